@@ -24,10 +24,10 @@ class Widget(Base):
     title = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     widget_data = Column(Text, nullable=False)  # JSON string
-    react_code = Column(Text, nullable=False)
-    embed_code = Column(Text, nullable=False)
+    react_code = Column(Text, nullable=True)  # Artifacts are rendered on demand
+    embed_code = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class User(Base):
     __tablename__ = "users"
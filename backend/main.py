@@ -1,15 +1,26 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+import html
 import json
 import os
 from dotenv import load_dotenv
 import redis
 import openai
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
+import asyncio
+import copy
+import threading
+import time
+from sqlalchemy.orm import Session
+from database.database import SessionLocal, Widget, get_db, init_db
+from services.resilience import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, call_with_retries
+from services.edit_sessions import EditSession, EditSessionStore, diff_json, diff_lines
+from services.search import MAX_OFFSET, WidgetSearchIndex
+from services.artifacts import ArtifactRenderer, UnknownTargetError, content_hash
 
 # Load environment variables
 load_dotenv()
@@ -18,13 +29,56 @@ load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # Initialize Redis (fallback to in-memory if not available)
+# Every Redis round-trip is bounded so a stalled server cannot outlast a request's deadline
+REDIS_TIMEOUT_SECONDS = float(os.getenv("REDIS_TIMEOUT_SECONDS", "0.5"))
 try:
-    redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    redis_client = redis.Redis.from_url(
+        os.getenv("REDIS_URL", "redis://localhost:6379"),
+        socket_timeout=REDIS_TIMEOUT_SECONDS,
+        socket_connect_timeout=REDIS_TIMEOUT_SECONDS
+    )
     redis_client.ping()
 except:
     redis_client = None
     print("Redis not available, using in-memory cache")
 
+# Initialize the database; widgets are still generated without it, just not stored
+try:
+    init_db()
+    database_available = True
+except Exception as e:
+    database_available = False
+    print(f"Database not available, widgets will not be stored: {e}")
+
+# Upstream resilience settings
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
+RENDER_RESERVE_SECONDS = float(os.getenv("RENDER_RESERVE_SECONDS", "1"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+
+# Circuit breaker around the OpenAI API, shared across workers through Redis when available
+openai_breaker = CircuitBreaker(
+    "openai",
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+    redis_client=redis_client
+)
+
+# Server-held state for WebSocket edit sessions
+edit_sessions = EditSessionStore(redis_client)
+PROGRESS_STEP_CHARS = 200
+
+# Search index over generated widgets, persisted to disk so restarts reload it quickly
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "./search_index.pkl")
+SEARCH_INDEX_SAVE_EVERY = int(os.getenv("SEARCH_INDEX_SAVE_EVERY", "100"))
+SEARCH_REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", "5"))
+# Catch-up queries overlap so rows committed late by another worker are not missed
+SEARCH_REFRESH_OVERLAP = timedelta(seconds=60)
+search_index = WidgetSearchIndex.load(SEARCH_INDEX_PATH)
+search_refresh = {"at": 0.0, "lock": threading.Lock()}
+
+# Code artifacts are rendered on first request and cached by widget content hash
+artifact_renderer = ArtifactRenderer(redis_client)
+
 app = FastAPI(title="StoryWeave AI", version="1.0.0")
 
 # CORS middleware
@@ -45,14 +99,25 @@ class EditRequest(BaseModel):
     widget_id: str
     edit_prompt: str
     current_widget: Dict[str, Any]
+    user_id: Optional[str] = None
 
 class WidgetResponse(BaseModel):
     widget_id: str
-    widget_data: Dict[str, Any]
-    react_code: str
-    embed_code: str
+    widget_data: Optional[Dict[str, Any]] = None
+    react_code: Optional[str] = None
+    embed_code: Optional[str] = None
+    html_code: Optional[str] = None
+    content_hash: Optional[str] = None
     timestamp: str
 
+class ArtifactRequest(BaseModel):
+    widget_id: str
+    widget_data: Dict[str, Any]
+    targets: List[str]
+
+# Fields returned when a request does not pass `fields=`
+DEFAULT_FIELDS = ["widget_id", "widget_data", "react_code", "embed_code", "timestamp"]
+
 # AI Meta-prompt for widget generation
 WIDGET_GENERATION_PROMPT = """
 You are an expert web developer and UI designer. Your task is to convert plain-English descriptions into fully functional web widgets.
@@ -116,10 +181,52 @@ User's edit request: {edit_prompt}
 Return ONLY the updated JSON with the requested changes applied. Maintain the same structure but update the relevant parts.
 """
 
-def generate_widget_with_ai(prompt: str) -> Dict[str, Any]:
+# Returned when the AI service fails; never stored or indexed
+FALLBACK_WIDGET = {
+    "widgetType": "custom",
+    "title": "Generated Widget",
+    "description": "A widget based on your request",
+    "elements": [
+        {
+            "type": "text",
+            "id": "title",
+            "label": "Your Widget",
+            "style": {"fontSize": "24px", "fontWeight": "bold"}
+        },
+        {
+            "type": "input",
+            "id": "input1",
+            "label": "Input Field",
+            "placeholder": "Enter something...",
+            "validation": "optional"
+        },
+        {
+            "type": "button",
+            "id": "submit",
+            "label": "Submit",
+            "style": {"backgroundColor": "#3b82f6", "color": "white"}
+        }
+    ],
+    "logic": {"onSubmit": "Process the input"},
+    "styling": {"theme": "light", "primaryColor": "#3b82f6"}
+}
+
+def call_openai(deadline: Deadline, **kwargs):
+    """Call the chat completion API with retries, bounded by the deadline and the circuit breaker"""
+    return call_with_retries(
+        lambda timeout: openai.ChatCompletion.create(request_timeout=timeout, **kwargs),
+        deadline,
+        breaker=openai_breaker,
+        max_retries=UPSTREAM_MAX_RETRIES,
+        reserve=RENDER_RESERVE_SECONDS
+    )
+
+def generate_widget_with_ai(prompt: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
     """Generate widget using OpenAI API"""
+    deadline = deadline or Deadline(REQUEST_DEADLINE_SECONDS)
     try:
-        response = openai.ChatCompletion.create(
+        response = call_openai(
+            deadline,
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are an expert web developer and UI designer."},
@@ -148,39 +255,15 @@ def generate_widget_with_ai(prompt: str) -> Dict[str, Any]:
     except Exception as e:
         print(f"AI generation error: {e}")
         # Fallback to a simple widget
-        return {
-            "widgetType": "custom",
-            "title": "Generated Widget",
-            "description": "A widget based on your request",
-            "elements": [
-                {
-                    "type": "text",
-                    "id": "title",
-                    "label": "Your Widget",
-                    "style": {"fontSize": "24px", "fontWeight": "bold"}
-                },
-                {
-                    "type": "input",
-                    "id": "input1",
-                    "label": "Input Field",
-                    "placeholder": "Enter something...",
-                    "validation": "optional"
-                },
-                {
-                    "type": "button",
-                    "id": "submit",
-                    "label": "Submit",
-                    "style": {"backgroundColor": "#3b82f6", "color": "white"}
-                }
-            ],
-            "logic": {"onSubmit": "Process the input"},
-            "styling": {"theme": "light", "primaryColor": "#3b82f6"}
-        }
+        return copy.deepcopy(FALLBACK_WIDGET)
 
-def edit_widget_with_ai(current_widget: Dict[str, Any], edit_prompt: str) -> Dict[str, Any]:
+def edit_widget_with_ai(current_widget: Dict[str, Any], edit_prompt: str,
+                        deadline: Optional[Deadline] = None) -> Dict[str, Any]:
     """Edit widget using conversational AI"""
+    deadline = deadline or Deadline(REQUEST_DEADLINE_SECONDS)
     try:
-        response = openai.ChatCompletion.create(
+        response = call_openai(
+            deadline,
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are an expert web developer."},
@@ -201,11 +284,59 @@ def edit_widget_with_ai(current_widget: Dict[str, Any], edit_prompt: str) -> Dic
         except json.JSONDecodeError:
             # If parsing fails, return original widget
             return current_widget
-            
+    
+    except (CircuitOpenError, DeadlineExceeded):
+        # The edit did not happen; let the endpoint report it instead of echoing the widget back
+        raise
     except Exception as e:
         print(f"AI editing error: {e}")
         return current_widget
 
+def stream_edit_with_ai(current_widget: Dict[str, Any], edit_prompt: str, history: List[Dict[str, str]],
+                        deadline: Deadline, on_progress) -> Dict[str, Any]:
+    """Edit widget with a streamed completion, reporting received characters as they arrive"""
+    response = call_openai(
+        deadline,
+        model="gpt-3.5-turbo",
+        messages=[{"role": "system", "content": "You are an expert web developer."}] + history + [
+            {"role": "user", "content": EDIT_PROMPT.format(
+                current_widget=json.dumps(current_widget, indent=2),
+                edit_prompt=edit_prompt
+            )}
+        ],
+        temperature=0.5,
+        max_tokens=2000,
+        stream=True
+    )
+    
+    content = ""
+    for chunk in response:
+        deadline.check("finishing the edit")
+        content += chunk.choices[0].delta.get("content", "")
+        on_progress(len(content))
+    
+    return json.loads(content.strip())
+
+def get_cached_widget(cache_key: str, deadline: Deadline) -> Optional[Dict[str, Any]]:
+    """Look up the prompt cache, skipping it when Redis could not answer within the deadline"""
+    if not redis_client or deadline.remaining(RENDER_RESERVE_SECONDS) < REDIS_TIMEOUT_SECONDS:
+        return None
+    try:
+        cached = redis_client.get(cache_key)
+        return json.loads(cached) if cached else None
+    except Exception as e:
+        print(f"Cache Redis error: {e}")
+        return None
+
+def cache_widget(cache_key: str, widget_id: str, widget_data: Dict[str, Any]):
+    """Cache a generated widget under its prompt"""
+    if not redis_client:
+        return
+    try:
+        redis_client.setex(cache_key, 3600, json.dumps({"widget_id": widget_id, "widget_data": widget_data}))
+    except Exception as e:
+        print(f"Cache Redis error: {e}")
+
 def generate_react_code(widget_data: Dict[str, Any]) -> str:
     """Generate React component code from widget data"""
     widget_type = widget_data.get("widgetType", "custom")
@@ -297,21 +428,20 @@ const {title.replace(" ", "")}Widget = () => {{
       </button>"""
         
         elif element_type == "question":
-            options = element.get("options", [])
-            react_code += f"""
-      <div style={{ marginBottom: '15px' }}>
-        <p style={{ marginBottom: '10px' }}>{label}</p>
-        {options.map((option, index) => f"""
-        <label key={index} style={{ display: 'block', marginBottom: '5px' }}>
+            options = "".join(f"""
+        <label key="{index}" style={{{{ display: 'block', marginBottom: '5px' }}}}>
           <input
             type="radio"
             name="{element_id}"
             value="{option}"
             onChange={{e => handleInputChange('{element_id}', e.target.value)}}
-            style={{ marginRight: '8px' }}
+            style={{{{ marginRight: '8px' }}}}
           />
           {option}
-        </label>""").join('')}
+        </label>""" for index, option in enumerate(element.get("options", []) or []))
+            react_code += f"""
+      <div style={{ marginBottom: '15px' }}>
+        <p style={{ marginBottom: '10px' }}>{label}</p>{options}
       </div>"""
     
     react_code += """
@@ -330,6 +460,155 @@ export default """ + title.replace(" ", "") + """Widget;
     
     return react_code
 
+def escape_html(value: Any, default: str = "") -> str:
+    """Escape a widget value for HTML text or a quoted attribute; None falls back to `default`"""
+    return html.escape(str(default if value is None or value == "" else value), quote=True)
+
+def generate_html_code(widget_data: Dict[str, Any]) -> str:
+    """Generate a standalone HTML/JS page from widget data"""
+    title = escape_html(widget_data.get("title"), "Widget")
+    styling = widget_data.get("styling")
+    styling = styling if isinstance(styling, dict) else {}
+    body = ""
+    
+    for element in widget_data.get("elements") or []:
+        if not isinstance(element, dict):
+            continue
+        element_type = element.get("type", "text")
+        element_id = escape_html(element.get("id"), "element")
+        label = escape_html(element.get("label"))
+        style = element.get("style")
+        style = style if isinstance(style, dict) else {}
+        
+        if element_type == "text":
+            body += f"""
+    <div style="font-size: {escape_html(style.get("fontSize"), "16px")}; font-weight: {escape_html(style.get("fontWeight"), "normal")}; margin-bottom: 10px;">{label}</div>"""
+        
+        elif element_type == "input":
+            placeholder = escape_html(element.get("placeholder"))
+            body += f"""
+    <div style="margin-bottom: 15px;">
+      <label style="display: block; margin-bottom: 5px;">{label}</label>
+      <input type="text" name="{element_id}" placeholder="{placeholder}" style="width: 100%; padding: 8px; border: 1px solid #ddd; border-radius: 4px; font-size: 14px;">
+    </div>"""
+        
+        elif element_type == "button":
+            body += f"""
+    <button type="submit" style="background-color: {escape_html(style.get("backgroundColor"), "#3b82f6")}; color: {escape_html(style.get("color"), "white")}; padding: 10px 20px; border: none; border-radius: 4px; cursor: pointer; font-size: 16px;">{label}</button>"""
+        
+        elif element_type == "question":
+            options = "".join(f"""
+      <label style="display: block; margin-bottom: 5px;"><input type="radio" name="{element_id}" value="{escape_html(option)}" style="margin-right: 8px;">{escape_html(option)}</label>"""
+                for option in element.get("options") or [])
+            body += f"""
+    <div style="margin-bottom: 15px;">
+      <p style="margin-bottom: 10px;">{label}</p>{options}
+    </div>"""
+    
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>{title}</title>
+</head>
+<body style="font-family: {escape_html(styling.get("fontFamily"), "Arial, sans-serif")};">
+  <form id="widget" style="padding: 20px; border-radius: 8px; background-color: {escape_html(styling.get("primaryColor"), "#ffffff")}; max-width: 500px; margin: 0 auto;">
+    <h2 style="margin-bottom: 20px; color: #333;">{title}</h2>{body}
+    <pre id="results" style="margin-top: 20px; padding: 15px; background-color: #f0f0f0; border-radius: 4px; display: none;"></pre>
+  </form>
+  <script>
+    document.getElementById('widget').addEventListener('submit', function (event) {{
+      event.preventDefault();
+      var results = document.getElementById('results');
+      results.textContent = JSON.stringify(Object.fromEntries(new FormData(event.target)), null, 2);
+      results.style.display = 'block';
+    }});
+  </script>
+</body>
+</html>
+"""
+
+def index_widget(widget_id: str, widget_data: Dict[str, Any], version: Any = None):
+    """Add a widget to the search index, saving the index every SEARCH_INDEX_SAVE_EVERY changes"""
+    try:
+        search_index.add(widget_id, widget_data, version)
+        if search_index.dirty >= SEARCH_INDEX_SAVE_EVERY:
+            search_index.save(SEARCH_INDEX_PATH)
+    except Exception as e:
+        print(f"Search indexing error for widget {widget_id}: {e}")
+
+def save_widget(widget_id: str, widget_data: Dict[str, Any], user_id: Optional[str] = None, edit: bool = False):
+    """Store a widget in the database and add it to the search index.
+
+    Stored widgets are shared: search hits are fetched for reuse and cached prompts
+    hand the same id to everyone. An `edit` is therefore only stored when it creates
+    the widget or the stored widget belongs to `user_id`; anyone else's edit stays local.
+    """
+    if not database_available:
+        if not edit:
+            index_widget(widget_id, widget_data)
+        return
+    db = SessionLocal()
+    try:
+        record = db.get(Widget, widget_id)
+        if record is None:
+            record = Widget(id=widget_id, user_id=user_id)
+        elif edit and (record.user_id is None or record.user_id != user_id):
+            return
+        record.title = str(widget_data.get("title") or "Widget")
+        record.description = widget_data.get("description")
+        record.widget_data = json.dumps(widget_data)
+        db.add(record)
+        db.commit()
+        version = record.updated_at
+    except Exception as e:
+        db.rollback()
+        print(f"Failed to store widget: {e}")
+        return
+    finally:
+        db.close()
+    index_widget(widget_id, widget_data, version)
+
+def refresh_search_index(force: bool = False):
+    """Catch the index up with widgets stored by any worker since its watermark.
+
+    The database is the source of truth: each worker keeps its own in-process
+    index and pulls rows saved by other workers at most every SEARCH_REFRESH_SECONDS.
+    A saved snapshot therefore never loses widgets; anything newer than its
+    watermark is reloaded from the database at startup. Rows whose updated_at the
+    index already holds are skipped, and a row that cannot be indexed is logged
+    without holding back the watermark.
+    """
+    if not database_available:
+        return
+    if not force and time.monotonic() - search_refresh["at"] < SEARCH_REFRESH_SECONDS:
+        return
+    if not search_refresh["lock"].acquire(blocking=False):
+        return
+    try:
+        started = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            query = db.query(Widget.id, Widget.widget_data, Widget.updated_at)
+            if search_index.watermark:
+                query = query.filter(Widget.updated_at >= search_index.watermark - SEARCH_REFRESH_OVERLAP)
+            for widget_id, widget_data, updated_at in query.yield_per(1000):
+                if updated_at is not None and search_index.indexed_version(widget_id) == updated_at:
+                    continue
+                try:
+                    search_index.add(widget_id, json.loads(widget_data), updated_at)
+                except Exception as e:
+                    print(f"Search indexing error for widget {widget_id}: {e}")
+        finally:
+            db.close()
+        search_index.watermark = started
+        search_refresh["at"] = time.monotonic()
+    except Exception as e:
+        print(f"Search index refresh error: {e}")
+    finally:
+        search_refresh["lock"].release()
+
 def generate_embed_code(widget_data: Dict[str, Any], widget_id: str) -> str:
     """Generate embed code for the widget"""
     return f"""
@@ -345,6 +624,45 @@ def generate_embed_code(widget_data: Dict[str, Any], widget_id: str) -> str:
 </script>
 """
 
+# Output targets; each is rendered only when a response or export asks for it
+artifact_renderer.register("react_code", lambda widget_data, widget_id: generate_react_code(widget_data))
+artifact_renderer.register("html_code", lambda widget_data, widget_id: generate_html_code(widget_data))
+artifact_renderer.register("embed_code", generate_embed_code, per_widget=True)
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Parse a comma-separated `fields=` selector, rejecting unknown fields"""
+    if not fields:
+        return DEFAULT_FIELDS
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in WidgetResponse.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+    return selected
+
+def build_widget_response(widget_id: str, widget_data: Dict[str, Any], fields: List[str]) -> WidgetResponse:
+    """Build a response with the selected fields, rendering only the requested artifacts"""
+    artifacts = artifact_renderer.render(
+        widget_data, widget_id, [field for field in fields if field in artifact_renderer.targets]
+    )
+    return WidgetResponse(
+        widget_id=widget_id,
+        widget_data=widget_data if "widget_data" in fields else None,
+        content_hash=content_hash(widget_data) if "content_hash" in fields else None,
+        timestamp=datetime.now().isoformat(),
+        **artifacts
+    )
+
+@app.on_event("startup")
+def load_search_index():
+    refresh_search_index(force=True)
+    # Sort the impact lists of common terms up front so first queries don't pay for it
+    threading.Thread(target=search_index.warm, daemon=True).start()
+
+@app.on_event("shutdown")
+def save_search_index():
+    if search_index.dirty:
+        search_index.save(SEARCH_INDEX_PATH)
+
 @app.get("/")
 async def root():
     return {"message": "StoryWeave AI API", "version": "1.0.0"}
@@ -364,81 +682,296 @@ async def get_examples():
     ]
     return {"examples": examples}
 
-@app.post("/api/generate-widget", response_model=WidgetResponse)
-async def generate_widget(request: WidgetRequest):
+# Generate and edit are plain functions so FastAPI runs them in its threadpool:
+# the upstream call and the cache and breaker round-trips never block the event loop
+@app.post("/api/generate-widget", response_model=WidgetResponse, response_model_exclude_none=True)
+def generate_widget(request: WidgetRequest, background_tasks: BackgroundTasks, fields: Optional[str] = None):
     """Generate a widget from plain-English description"""
+    deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+    selected = parse_fields(fields)
     try:
         # Check cache first
         cache_key = f"widget:{hash(request.prompt)}"
-        if redis_client:
-            cached = redis_client.get(cache_key)
-            if cached:
-                cached_data = json.loads(cached)
-                return WidgetResponse(**cached_data)
+        cached_data = get_cached_widget(cache_key, deadline)
+        if cached_data:
+            return build_widget_response(cached_data["widget_id"], cached_data["widget_data"], selected)
         
         # Generate widget with AI
-        widget_data = generate_widget_with_ai(request.prompt)
+        widget_data = generate_widget_with_ai(request.prompt, deadline)
         
         # Generate widget ID
         widget_id = str(uuid.uuid4())
         
-        # Generate code
-        react_code = generate_react_code(widget_data)
-        embed_code = generate_embed_code(widget_data, widget_id)
-        
-        # Create response
-        response = WidgetResponse(
-            widget_id=widget_id,
-            widget_data=widget_data,
-            react_code=react_code,
-            embed_code=embed_code,
-            timestamp=datetime.now().isoformat()
-        )
+        # Generate only the requested code artifacts
+        deadline.check("rendering")
+        response = build_widget_response(widget_id, widget_data, selected)
         
-        # Cache the result
-        if redis_client:
-            redis_client.setex(cache_key, 3600, json.dumps(response.dict()))
+        # Cache, store and index once the response is sent, unless the AI call failed;
+        # artifacts are cached separately by content hash
+        if widget_data != FALLBACK_WIDGET:
+            background_tasks.add_task(cache_widget, cache_key, widget_id, widget_data)
+            background_tasks.add_task(save_widget, widget_id, widget_data, request.user_id)
         
         return response
         
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Failed to generate widget: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate widget: {str(e)}")
 
-@app.post("/api/edit-widget", response_model=WidgetResponse)
-async def edit_widget(request: EditRequest):
+@app.post("/api/edit-widget", response_model=WidgetResponse, response_model_exclude_none=True)
+def edit_widget(request: EditRequest, background_tasks: BackgroundTasks, fields: Optional[str] = None):
     """Edit widget using conversational language"""
+    deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+    selected = parse_fields(fields)
     try:
         # Edit widget with AI
-        updated_widget_data = edit_widget_with_ai(request.current_widget, request.edit_prompt)
+        updated_widget_data = edit_widget_with_ai(request.current_widget, request.edit_prompt, deadline)
         
-        # Generate updated code
-        react_code = generate_react_code(updated_widget_data)
-        embed_code = generate_embed_code(updated_widget_data, request.widget_id)
+        # Generate only the requested code artifacts
+        deadline.check("rendering")
+        response = build_widget_response(request.widget_id, updated_widget_data, selected)
         
-        return WidgetResponse(
-            widget_id=request.widget_id,
-            widget_data=updated_widget_data,
-            react_code=react_code,
-            embed_code=embed_code,
-            timestamp=datetime.now().isoformat()
-        )
+        # Nothing to store when the model call failed and we got the client's widget back
+        if updated_widget_data != request.current_widget:
+            background_tasks.add_task(save_widget, request.widget_id, updated_widget_data, request.user_id, True)
+        
+        return response
         
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Failed to edit widget: {str(e)}")
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Failed to edit widget: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to edit widget: {str(e)}")
 
+# Export and artifact rendering are plain functions too: rendering is CPU-bound and
+# the artifact cache may hit Redis, so both stay off the event loop
 @app.post("/api/export-widget")
-async def export_widget(widget_response: WidgetResponse):
+def export_widget(widget_response: WidgetResponse):
     """Export widget in various formats"""
+    if widget_response.widget_data is None:
+        raise HTTPException(status_code=400, detail="widget_data is required to export a widget")
     try:
+        # Fill in any artifacts the client never fetched
+        artifacts = artifact_renderer.render(
+            widget_response.widget_data,
+            widget_response.widget_id,
+            [name for name in ("react_code", "embed_code") if getattr(widget_response, name) is None]
+        )
         return {
-            "react_code": widget_response.react_code,
-            "embed_code": widget_response.embed_code,
+            "react_code": widget_response.react_code or artifacts.get("react_code"),
+            "embed_code": widget_response.embed_code or artifacts.get("embed_code"),
             "widget_data": widget_response.widget_data,
             "download_url": f"/api/download/{widget_response.widget_id}"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to export widget: {str(e)}")
 
+@app.post("/api/artifacts")
+def get_artifacts(request: ArtifactRequest):
+    """Render code artifacts on demand for the requested output targets"""
+    try:
+        artifacts = artifact_renderer.render(request.widget_data, request.widget_id, request.targets)
+    except UnknownTargetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to render artifacts: {str(e)}")
+    return {
+        "widget_id": request.widget_id,
+        "content_hash": content_hash(request.widget_data),
+        "artifacts": artifacts
+    }
+
+# Search endpoints are plain functions so FastAPI runs them in its threadpool,
+# keeping index locks and database catch-up off the event loop
+@app.get("/api/widgets/search")
+def search_widgets(q: str, limit: int = Query(10, ge=1, le=50), offset: int = Query(0, ge=0, le=MAX_OFFSET)):
+    """Search stored widgets by title, description, element labels and type"""
+    refresh_search_index()
+    total, results = search_index.search(q, limit, offset)
+    return {"query": q, "total": total, "limit": limit, "offset": offset, "results": results}
+
+@app.get("/api/widgets/{widget_id}", response_model=WidgetResponse, response_model_exclude_none=True)
+def get_widget(widget_id: str, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """Fetch a stored widget, e.g. to reuse a search hit instead of generating a new one"""
+    selected = parse_fields(fields)
+    if not database_available:
+        raise HTTPException(status_code=503, detail="Widget storage is not available")
+    record = db.get(Widget, widget_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Widget not found")
+    return build_widget_response(widget_id, json.loads(record.widget_data), selected)
+
+@app.get("/api/widgets/{widget_id}/similar")
+def similar_widgets(widget_id: str, limit: int = Query(10, ge=1, le=50), offset: int = Query(0, ge=0, le=MAX_OFFSET)):
+    """Find widgets similar to an existing one"""
+    refresh_search_index()
+    found = search_index.similar(widget_id, limit, offset)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Widget not found")
+    total, results = found
+    return {"widget_id": widget_id, "total": total, "limit": limit, "offset": offset, "results": results}
+
+def parse_session_message(raw: str) -> Dict[str, Any]:
+    """Parse and validate one client message of an edit session"""
+    try:
+        message = json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError("Messages must be JSON")
+    if not isinstance(message, dict):
+        raise ValueError("Messages must be JSON objects")
+    if "version" in message and (not isinstance(message["version"], int) or isinstance(message["version"], bool)):
+        raise ValueError("version must be an integer")
+    for key in ("session_id", "user_id"):
+        if key in message and not isinstance(message[key], (str, type(None))):
+            raise ValueError(f"{key} must be a string")
+    if "widget_data" in message and not isinstance(message["widget_data"], dict):
+        raise ValueError("widget_data must be an object")
+    if "edit_prompt" in message and not isinstance(message["edit_prompt"], str):
+        raise ValueError("edit_prompt must be a string")
+    if not isinstance(message.get("code_fields", []), list):
+        raise ValueError("code_fields must be a list")
+    return message
+
+def session_snapshot(session: EditSession, code_fields: List[str]) -> Dict[str, Any]:
+    """Full state of a session, for clients that cannot catch up from patches"""
+    return {
+        "type": "snapshot",
+        "session_id": session.session_id,
+        "version": session.version,
+        "widget_data": session.widget_data,
+        **artifact_renderer.render(session.widget_data, session.widget_id, code_fields)
+    }
+
+@app.websocket("/ws/edit/{widget_id}")
+async def edit_session(websocket: WebSocket, widget_id: str):
+    """Conversational edit session that keeps the widget on the server and pushes only diffs.
+
+    Client messages:
+      {"type": "start", "widget_data": {...}, "user_id": "..."}                begin a new session at version 0
+      {"type": "resume", "session_id": "...", "version": n}                   reattach after a dropped connection
+      {"type": "edit", "session_id": "...", "version": n, "edit_prompt": "..."}  apply a conversational edit
+    
+    Every `start` gets a fresh session_id, so a client holding an older session
+    is never told it is in sync just because the version numbers match.
+    An edit made against another session or version, or one that loses a race
+    with another connection, is answered with a snapshot instead of a patch.
+    `resume` and `edit` may pass "code_fields", the artifacts the client holds;
+    only those are included in snapshots and diffed into code hunks.
+    """
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    
+    # Session store and artifact cache round-trips may hit Redis, so they run off the event loop
+    def run(func, *args):
+        return loop.run_in_executor(None, func, *args)
+    
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = parse_session_message(raw)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "message": str(e)})
+                continue
+            
+            message_type = message.get("type")
+            code_fields = [name for name in message.get("code_fields", []) if name in artifact_renderer.targets]
+            
+            if message_type == "start":
+                session = EditSession(widget_id, message.get("widget_data") or {}, user_id=message.get("user_id"))
+                await run(edit_sessions.save, session)
+                await websocket.send_json({"type": "ready", "session_id": session.session_id, "version": session.version})
+                continue
+            
+            if message_type not in ("resume", "edit"):
+                await websocket.send_json({"type": "error", "message": f"Unknown message type: {message_type}"})
+                continue
+            
+            session = await run(edit_sessions.get, widget_id)
+            if not session:
+                await websocket.send_json({"type": "resync_required"})
+                continue
+            in_step = message.get("session_id") == session.session_id and message.get("version") == session.version
+            
+            if message_type == "resume":
+                # Replay missed patches when we still have them, otherwise send a snapshot
+                patches = None
+                if message.get("session_id") == session.session_id:
+                    patches = session.patches_since(message.get("version", -1))
+                if patches is None:
+                    await websocket.send_json(await run(session_snapshot, session, code_fields))
+                else:
+                    for patch in patches:
+                        await websocket.send_json(patch)
+                    await websocket.send_json({"type": "ready", "session_id": session.session_id, "version": session.version})
+            
+            elif not in_step:
+                # The client edited a document the server no longer holds
+                await websocket.send_json(await run(session_snapshot, session, code_fields))
+            
+            else:
+                edit_prompt = message.get("edit_prompt", "")
+                base_version = session.version
+                deadline = Deadline(REQUEST_DEADLINE_SECONDS)
+                sent = {"chars": 0}
+                
+                def on_progress(received: int):
+                    if received - sent["chars"] >= PROGRESS_STEP_CHARS:
+                        sent["chars"] = received
+                        asyncio.run_coroutine_threadsafe(
+                            websocket.send_json({"type": "progress", "received_chars": received}), loop
+                        ).result()
+                
+                await websocket.send_json({"type": "progress", "received_chars": 0})
+                try:
+                    updated_widget_data = await run(
+                        stream_edit_with_ai, session.widget_data, edit_prompt,
+                        session.history, deadline, on_progress
+                    )
+                    if not isinstance(updated_widget_data, dict):
+                        raise ValueError("the model did not return a widget object")
+                    deadline.check("rendering")
+                    
+                    code_hunks = {}
+                    old_code, new_code = await run(lambda: (
+                        artifact_renderer.render(session.widget_data, widget_id, code_fields),
+                        artifact_renderer.render(updated_widget_data, widget_id, code_fields)
+                    ))
+                    for name in code_fields:
+                        hunks = diff_lines(old_code[name], new_code[name])
+                        if hunks:
+                            code_hunks[name] = hunks
+                except Exception as e:
+                    print(f"AI editing error: {e}")
+                    await websocket.send_json({
+                        "type": "error",
+                        "version": session.version,
+                        "message": f"Failed to edit widget: {str(e)}"
+                    })
+                    continue
+                
+                patch = session.record_edit(
+                    updated_widget_data,
+                    diff_json(session.widget_data, updated_widget_data),
+                    code_hunks,
+                    edit_prompt
+                )
+                # Another connection may have started or edited the session during the model call
+                if not await run(edit_sessions.save_if_current, session, base_version):
+                    latest = await run(edit_sessions.get, widget_id)
+                    if latest:
+                        await websocket.send_json(await run(session_snapshot, latest, code_fields))
+                    else:
+                        await websocket.send_json({"type": "resync_required"})
+                    continue
+                await websocket.send_json(patch)
+                await run(save_widget, widget_id, updated_widget_data, session.user_id, True)
+    
+    except WebSocketDisconnect:
+        pass
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
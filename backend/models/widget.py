@@ -40,14 +40,22 @@ class WidgetEdit(BaseModel):
     widget_id: str
     edit_prompt: str
     current_widget: Dict[str, Any]
+    user_id: Optional[str] = None
 
 class WidgetResponse(BaseModel):
     widget_id: str
-    widget_data: Dict[str, Any]
-    react_code: str
-    embed_code: str
+    widget_data: Optional[Dict[str, Any]] = None
+    react_code: Optional[str] = None
+    embed_code: Optional[str] = None
+    html_code: Optional[str] = None
+    content_hash: Optional[str] = None
     timestamp: str
 
+class ArtifactRequest(BaseModel):
+    widget_id: str
+    widget_data: Dict[str, Any]
+    targets: List[str]
+
 class WidgetExport(BaseModel):
     react_code: str
     embed_code: str
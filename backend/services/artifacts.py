@@ -0,0 +1,96 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Renderers are registered by name, e.g. "react_code" -> generate_react_code
+Renderer = Callable[[Dict[str, Any], str], str]
+
+
+class UnknownTargetError(ValueError):
+    """Raised when an artifact is requested for a target nobody registered"""
+
+
+def content_hash(widget_data: Dict[str, Any]) -> str:
+    """Stable hash of widget content, independent of key order"""
+    encoded = json.dumps(widget_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ArtifactRenderer:
+    """Registry of output targets that renders code artifacts on demand.
+
+    Artifacts are cached by the content hash of `widget_data` (plus the widget id
+    for targets that embed it), in Redis when available and in a small in-process
+    LRU otherwise. Rendering is CPU-bound string building, so it runs inline in the
+    caller's thread; callers on an event loop should hand the whole batch to an executor.
+    """
+
+    def __init__(self, redis_client=None, ttl: int = 3600, max_local: int = 512):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.max_local = max_local
+        self.targets: Dict[str, Renderer] = {}
+        self.per_widget: Dict[str, bool] = {}
+        self._local: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name: str, renderer: Renderer, per_widget: bool = False):
+        """Add an output target; `per_widget` targets depend on the widget id as well as its content"""
+        self.targets[name] = renderer
+        self.per_widget[name] = per_widget
+
+    def _key(self, name: str, digest: str, widget_id: str) -> str:
+        if self.per_widget[name]:
+            return f"artifact:{name}:{digest}:{widget_id}"
+        return f"artifact:{name}:{digest}"
+
+    def _get(self, key: str) -> Optional[str]:
+        if self.redis_client:
+            try:
+                cached = self.redis_client.get(key)
+                return cached.decode("utf-8") if isinstance(cached, bytes) else cached
+            except Exception as e:
+                print(f"Artifact cache Redis error: {e}")
+        with self._lock:
+            if key in self._local:
+                self._local.move_to_end(key)
+                return self._local[key]
+        return None
+
+    def _set(self, key: str, value: str):
+        if self.redis_client:
+            try:
+                self.redis_client.setex(key, self.ttl, value)
+                return
+            except Exception as e:
+                print(f"Artifact cache Redis error: {e}")
+        with self._lock:
+            self._local[key] = value
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+    def render(self, widget_data: Dict[str, Any], widget_id: str, targets: Iterable[str]) -> Dict[str, str]:
+        """Return the requested artifacts, rendering only those not already cached"""
+        targets = list(dict.fromkeys(targets))
+        unknown = [name for name in targets if name not in self.targets]
+        if unknown:
+            raise UnknownTargetError(f"Unknown output target(s): {', '.join(unknown)}")
+
+        digest = content_hash(widget_data)
+        artifacts: Dict[str, str] = {}
+        missing: List[str] = []
+        for name in targets:
+            cached = self._get(self._key(name, digest, widget_id))
+            if cached is None:
+                missing.append(name)
+            else:
+                artifacts[name] = cached
+
+        for name in missing:
+            value = self.targets[name](widget_data, widget_id)
+            self._set(self._key(name, digest, widget_id), value)
+            artifacts[name] = value
+        return {name: artifacts[name] for name in targets}
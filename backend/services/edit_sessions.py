@@ -0,0 +1,258 @@
+import copy
+import difflib
+import json
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:  # Redis is optional; without it sessions live in memory
+    WatchError = None
+
+# How many recent edits are kept for prompt context and for replaying to a resuming client
+MAX_HISTORY = 10
+MAX_PATCH_LOG = 20
+
+
+def _escape(key: str) -> str:
+    """Escape a key for use in a JSON Pointer (RFC 6901)"""
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff_json(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """Return JSON-Patch style add/remove/replace operations that turn `old` into `new`"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(diff_json(old[key], value, child))
+        return ops
+
+    if isinstance(old, list) and isinstance(new, list):
+        ops = []
+        common = min(len(old), len(new))
+        for index in range(common):
+            ops.extend(diff_json(old[index], new[index], f"{path}/{index}"))
+        for index in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{index}", "value": new[index]})
+        # Remove from the end so earlier indices stay valid
+        for index in reversed(range(common, len(old))):
+            ops.append({"op": "remove", "path": f"{path}/{index}"})
+        return ops
+
+    if type(old) is not type(new) or old != new:
+        return [{"op": "replace", "path": path, "value": new}]
+    return []
+
+
+def apply_json_patch(document: Any, ops: List[Dict[str, Any]]) -> Any:
+    """Apply operations produced by diff_json and return the patched copy"""
+    document = copy.deepcopy(document)
+    for op in ops:
+        if op["path"] == "":
+            document = copy.deepcopy(op.get("value"))
+            continue
+
+        tokens = [_unescape(token) for token in op["path"].split("/")[1:]]
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+
+        if isinstance(parent, list):
+            index = int(last)
+            if op["op"] == "add":
+                parent.insert(index, copy.deepcopy(op["value"]))
+            elif op["op"] == "remove":
+                del parent[index]
+            else:
+                parent[index] = copy.deepcopy(op["value"])
+        elif op["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(op["value"])
+    return document
+
+
+def _split_lines(text: str) -> List[str]:
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def diff_lines(old: str, new: str) -> List[Dict[str, Any]]:
+    """Return line hunks that turn `old` into `new`.
+
+    Each hunk replaces `delete` lines starting at line `start` of the old text
+    with `lines`; clients apply hunks from last to first.
+    """
+    # Split on "\n" only, as the client does; str.splitlines also breaks on \r, \x85, \u2028...
+    old_lines = _split_lines(old)
+    new_lines = _split_lines(new)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        {"start": i1, "delete": i2 - i1, "lines": new_lines[j1:j2]}
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_hunks(text: str, hunks: List[Dict[str, Any]]) -> str:
+    """Apply hunks produced by diff_lines"""
+    lines = _split_lines(text)
+    for hunk in reversed(hunks):
+        lines[hunk["start"]:hunk["start"] + hunk["delete"]] = hunk["lines"]
+    return "".join(lines)
+
+
+def summarize_ops(ops: List[Dict[str, Any]]) -> str:
+    """Short, human-readable description of a widget patch for the conversation history"""
+    if not ops:
+        return "No changes were needed."
+    paths = sorted({op["path"] or "/" for op in ops})
+    shown = ", ".join(paths[:5])
+    if len(paths) > 5:
+        shown += f" and {len(paths) - 5} more"
+    return f"Updated {shown}."
+
+
+class EditSession:
+    """Server-held state of one conversational editing session"""
+
+    def __init__(self, widget_id: str, widget_data: Dict[str, Any], version: int = 0,
+                 history: Optional[List[Dict[str, str]]] = None,
+                 patches: Optional[List[Dict[str, Any]]] = None, session_id: Optional[str] = None,
+                 user_id: Optional[str] = None):
+        self.widget_id = widget_id
+        self.session_id = session_id or str(uuid.uuid4())
+        self.user_id = user_id
+        self.widget_data = widget_data
+        self.version = version
+        self.history = history or []
+        self.patches = patches or []
+
+    def record_edit(self, widget_data: Dict[str, Any], widget_ops: List[Dict[str, Any]],
+                    code_hunks: Dict[str, List[Dict[str, Any]]], edit_prompt: str) -> Dict[str, Any]:
+        """Move the session to a new version and return the patch message for the client"""
+        self.version += 1
+        self.widget_data = widget_data
+        patch = {
+            "type": "patch",
+            "session_id": self.session_id,
+            "version": self.version,
+            "base_version": self.version - 1,
+            "widget_ops": widget_ops,
+            "code_hunks": code_hunks,
+        }
+        self.patches = (self.patches + [patch])[-MAX_PATCH_LOG:]
+        self.history = (self.history + [
+            {"role": "user", "content": edit_prompt},
+            {"role": "assistant", "content": summarize_ops(widget_ops)},
+        ])[-MAX_HISTORY * 2:]
+        return patch
+
+    def patches_since(self, version: int) -> Optional[List[Dict[str, Any]]]:
+        """Patches a client at `version` needs, or None if they are no longer in the log"""
+        if version == self.version:
+            return []
+        if version > self.version:
+            return None
+        missed = [patch for patch in self.patches if patch["version"] > version]
+        if not missed or missed[0]["base_version"] != version:
+            return None
+        return missed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "widget_id": self.widget_id,
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "widget_data": self.widget_data,
+            "version": self.version,
+            "history": self.history,
+            "patches": self.patches,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "EditSession":
+        return cls(**data)
+
+
+class EditSessionStore:
+    """Keeps edit sessions in Redis when available so any worker can resume them"""
+
+    def __init__(self, redis_client=None, ttl: int = 3600):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+
+    def _key(self, widget_id: str) -> str:
+        return f"edit_session:{widget_id}"
+
+    def get(self, widget_id: str) -> Optional[EditSession]:
+        if self.redis_client:
+            try:
+                cached = self.redis_client.get(self._key(widget_id))
+                return EditSession.from_dict(json.loads(cached)) if cached else None
+            except Exception as e:
+                print(f"Edit session Redis error: {e}")
+        with self._lock:
+            data = self._sessions.get(widget_id)
+        return EditSession.from_dict(copy.deepcopy(data)) if data else None
+
+    def save(self, session: EditSession):
+        data = session.to_dict()
+        if self.redis_client:
+            try:
+                self.redis_client.setex(self._key(session.widget_id), self.ttl, json.dumps(data))
+                return
+            except Exception as e:
+                print(f"Edit session Redis error: {e}")
+        with self._lock:
+            self._sessions[session.widget_id] = copy.deepcopy(data)
+
+    def save_if_current(self, session: EditSession, base_version: int) -> bool:
+        """Save `session` only if the stored session is still the one it was edited from.
+
+        Returns False when another connection started a new session or saved an
+        edit in the meantime; the caller should then resync its client instead.
+        """
+        data = session.to_dict()
+
+        def is_current(stored: Optional[Dict[str, Any]]) -> bool:
+            return bool(stored) and stored["session_id"] == session.session_id and stored["version"] == base_version
+
+        if self.redis_client:
+            key = self._key(session.widget_id)
+            try:
+                with self.redis_client.pipeline() as pipe:
+                    pipe.watch(key)
+                    stored = pipe.get(key)
+                    if not is_current(json.loads(stored) if stored else None):
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    pipe.setex(key, self.ttl, json.dumps(data))
+                    pipe.execute()
+                    return True
+            except Exception as e:
+                if WatchError and isinstance(e, WatchError):
+                    return False
+                print(f"Edit session Redis error: {e}")
+        with self._lock:
+            if not is_current(self._sessions.get(session.widget_id)):
+                return False
+            self._sessions[session.widget_id] = copy.deepcopy(data)
+            return True
@@ -0,0 +1,202 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has used up its time budget"""
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker refuses a call to an unhealthy upstream"""
+
+
+class Deadline:
+    """Time budget for a single request, shared by every step that serves it"""
+
+    def __init__(self, budget: float):
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        """Seconds left, keeping `reserve` seconds back for later steps"""
+        return max(0.0, self.expires_at - time.monotonic() - reserve)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, step: str = "request"):
+        """Raise DeadlineExceeded if there is no time left for `step`"""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline exceeded before {step}")
+
+
+class CircuitBreaker:
+    """Closed / open / half-open circuit breaker around an upstream dependency.
+
+    When a Redis client is given, the failure count, the open timestamp and the
+    half-open probe lock live in Redis so every worker sees the same state.
+    Without Redis (or if Redis errors) the breaker falls back to process-local state.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 redis_client=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.redis_client = redis_client
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_until = 0.0
+
+    def _key(self, suffix: str) -> str:
+        return f"circuit:{self.name}:{suffix}"
+
+    def _get_opened_at(self) -> Optional[float]:
+        if self.redis_client:
+            try:
+                value = self.redis_client.get(self._key("opened_at"))
+                return float(value) if value is not None else None
+            except Exception as e:
+                print(f"Circuit breaker Redis error: {e}")
+        return self._opened_at
+
+    @property
+    def state(self) -> str:
+        opened_at = self._get_opened_at()
+        if opened_at is None:
+            return self.CLOSED
+        if time.time() - opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow_request(self) -> bool:
+        """Return True if a call may go upstream; only one probe is let through while half-open"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+
+        if self.redis_client:
+            try:
+                return bool(self.redis_client.set(
+                    self._key("probe"), "1", nx=True, ex=max(1, int(self.reset_timeout))
+                ))
+            except Exception as e:
+                print(f"Circuit breaker Redis error: {e}")
+        with self._lock:
+            now = time.time()
+            if now < self._probe_until:
+                return False
+            self._probe_until = now + self.reset_timeout
+            return True
+
+    def release(self):
+        """Give up a half-open probe without judging upstream health"""
+        if self.redis_client:
+            try:
+                self.redis_client.delete(self._key("probe"))
+            except Exception as e:
+                print(f"Circuit breaker Redis error: {e}")
+        with self._lock:
+            self._probe_until = 0.0
+
+    def record_success(self):
+        if self.redis_client:
+            try:
+                self.redis_client.delete(self._key("failures"), self._key("opened_at"), self._key("probe"))
+            except Exception as e:
+                print(f"Circuit breaker Redis error: {e}")
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_until = 0.0
+
+    def record_failure(self):
+        now = time.time()
+        if self.redis_client:
+            try:
+                if self.redis_client.get(self._key("opened_at")) is not None:
+                    # A failed half-open probe re-opens the circuit for another full timeout
+                    self.redis_client.set(self._key("opened_at"), now)
+                    self.redis_client.delete(self._key("probe"))
+                elif self.redis_client.incr(self._key("failures")) >= self.failure_threshold:
+                    self.redis_client.set(self._key("opened_at"), now)
+                    print(f"Circuit '{self.name}' opened")
+                return
+            except Exception as e:
+                print(f"Circuit breaker Redis error: {e}")
+        with self._lock:
+            if self._opened_at is not None:
+                self._opened_at = now
+                self._probe_until = 0.0
+                return
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = now
+                print(f"Circuit '{self.name}' opened")
+
+
+# Exception class names used for transient failures by the 0.x and 1.x OpenAI clients
+TRANSIENT_ERROR_NAMES = {
+    "Timeout", "APITimeoutError", "APIConnectionError", "RateLimitError",
+    "ServiceUnavailableError", "InternalServerError", "TryAgain"
+}
+
+
+def is_transient(error: Exception) -> bool:
+    """True for timeouts, connection errors, 429 and 5xx responses; other errors won't go away on retry"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in TRANSIENT_ERROR_NAMES:
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "http_status", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def call_with_retries(func: Callable[[float], Any], deadline: Deadline, breaker: Optional[CircuitBreaker] = None,
+                      max_retries: int = 2, base_delay: float = 0.25, max_delay: float = 2.0,
+                      reserve: float = 0.0, retryable: Callable[[Exception], bool] = is_transient) -> Any:
+    """Call `func(timeout)` with jittered exponential backoff, staying inside the deadline.
+
+    `func` receives the seconds it may spend on this attempt. Only errors accepted
+    by `retryable` are retried and counted against the breaker; anything else is
+    raised straight away. An open breaker fails fast with CircuitOpenError.
+    """
+    attempt = 0
+    while True:
+        timeout = deadline.remaining(reserve)
+        if timeout <= 0:
+            raise DeadlineExceeded("Deadline exceeded before upstream call")
+
+        if breaker and not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit '{breaker.name}' is open")
+
+        try:
+            result = func(timeout)
+        except Exception as e:
+            if not retryable(e):
+                if breaker:
+                    breaker.release()
+                raise
+            if breaker:
+                breaker.record_failure()
+            if attempt >= max_retries:
+                raise
+            # Full jitter: sleep anywhere up to the capped exponential backoff
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            if delay >= deadline.remaining(reserve):
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        if breaker:
+            breaker.record_success()
+        return result
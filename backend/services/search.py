@@ -0,0 +1,377 @@
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "me", "my", "of", "on", "or", "the", "this", "to", "with", "your"
+}
+
+# Title words count double; labels, description and widgetType count once
+TITLE_WEIGHT = 2
+
+# Queries whose postings add up to fewer entries than this are scored exhaustively;
+# larger ones use impact-sorted postings with early termination
+EXHAUSTIVE_LIMIT = 5000
+
+# Most documents scored per query on the early-termination path; broad queries of
+# only very common terms return the best of these instead of an exhaustive ranking
+SCORE_BUDGET = 2000
+
+# Rebuild a cached impact list once this share of its postings was added after it was sorted
+FRESH_RATIO = 0.1
+
+# Deepest result offset the endpoints serve; every page costs offset + limit scored documents
+MAX_OFFSET = 1000
+
+
+def tokenize(value: Any) -> List[str]:
+    """Tokens of a field value; numbers are indexed as text, nested objects and lists are skipped"""
+    if value is None or isinstance(value, (dict, list)):
+        return []
+    return [token for token in TOKEN_RE.findall(str(value).lower()) if token not in STOPWORDS]
+
+
+def widget_terms(widget_data: Dict[str, Any]) -> Dict[str, int]:
+    """Term frequencies for the searchable fields of a widget"""
+    tokens = tokenize(widget_data.get("title")) * TITLE_WEIGHT
+    tokens += tokenize(widget_data.get("description"))
+    tokens += tokenize(widget_data.get("widgetType"))
+    elements = widget_data.get("elements")
+    for element in elements if isinstance(elements, list) else []:
+        if isinstance(element, dict):
+            tokens += tokenize(element.get("label"))
+
+    terms: Dict[str, int] = {}
+    for token in tokens:
+        terms[token] = terms.get(token, 0) + 1
+    return terms
+
+
+class WidgetSearchIndex:
+    """In-process inverted index over stored widgets, ranked with BM25"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_terms: Dict[int, Dict[str, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.doc_info: Dict[int, Dict[str, Any]] = {}
+        self.doc_ids: Dict[str, int] = {}
+        self.widget_ids: Dict[int, str] = {}
+        self.versions: Dict[str, Any] = {}
+        self.next_doc = 0
+        self.total_length = 0
+        self.watermark: Optional[datetime] = None
+        self.dirty = 0
+        self._saving = False
+        self._pending: List[Tuple[str, str, Optional[Dict[str, Any]], Any]] = []
+        self._save_lock = threading.Lock()
+        self._impact_cache: Dict[str, List[Tuple[float, int]]] = {}
+        self._fresh: Dict[str, set] = {}
+        self._building: Dict[str, set] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def indexed_version(self, widget_id: str) -> Any:
+        """The `version` a widget was last indexed with, e.g. its updated_at timestamp"""
+        return self.versions.get(widget_id)
+
+    def add(self, widget_id: str, widget_data: Dict[str, Any], version: Any = None):
+        """Index a widget, replacing any earlier version with the same id.
+
+        Re-adding a widget with the `version` it is already indexed at is a no-op,
+        so catch-up passes over recently updated rows do not churn the index.
+        """
+        if version is not None and self.versions.get(widget_id) == version:
+            return
+        terms = widget_terms(widget_data)
+        with self._lock:
+            if self._saving:
+                self._pending.append(("add", widget_id, widget_data, version))
+                return
+            self._remove(widget_id)
+            if version is not None:
+                self.versions[widget_id] = version
+            doc = self.next_doc
+            self.next_doc += 1
+            self.doc_ids[widget_id] = doc
+            self.widget_ids[doc] = widget_id
+            self.doc_terms[doc] = terms
+            self.doc_lengths[doc] = sum(terms.values())
+            self.total_length += self.doc_lengths[doc]
+            self.doc_info[doc] = {
+                "title": widget_data.get("title", ""),
+                "description": widget_data.get("description", ""),
+                "widgetType": widget_data.get("widgetType", "custom"),
+            }
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[doc] = frequency
+                if term in self._building:
+                    self._building[term].add(doc)
+                if term in self._impact_cache:
+                    fresh = self._fresh[term]
+                    fresh.add(doc)
+                    if len(fresh) > len(self._impact_cache[term]) * FRESH_RATIO:
+                        del self._impact_cache[term]
+                        del self._fresh[term]
+            self.dirty += 1
+
+    def remove(self, widget_id: str):
+        with self._lock:
+            if self._saving:
+                self._pending.append(("remove", widget_id, None, None))
+                return
+            self._remove(widget_id)
+
+    def _remove(self, widget_id: str):
+        self.versions.pop(widget_id, None)
+        doc = self.doc_ids.pop(widget_id, None)
+        if doc is None:
+            return
+        for term in self.doc_terms.pop(doc):
+            postings = self.postings[term]
+            del postings[doc]
+            if not postings:
+                del self.postings[term]
+                self._impact_cache.pop(term, None)
+                self._fresh.pop(term, None)
+        self.total_length -= self.doc_lengths.pop(doc)
+        del self.doc_info[doc]
+        del self.widget_ids[doc]
+        self.dirty += 1
+
+    @staticmethod
+    def _sort_impacts(postings: List[Tuple[int, int]], doc_lengths: Dict[int, int],
+                      k1: float, b: float, avgdl: float) -> List[Tuple[float, int]]:
+        """BM25 term weights (without idf) of `postings`, highest first.
+
+        Documents removed since `postings` was copied have no length and are skipped;
+        a document's length never changes, since re-adding gives it a new doc id.
+        """
+        return sorted(
+            (
+                (frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / avgdl)), doc)
+                for doc, frequency in postings
+                if (length := doc_lengths.get(doc)) is not None
+            ),
+            reverse=True
+        )
+
+    def _impacts(self, term: str, avgdl: float) -> List[Tuple[float, int]]:
+        """Postings of `term` sorted by BM25 term weight, from the cache when possible.
+
+        Lists are cached and reused while only a few documents have been added
+        since they were built; those newer documents are scored separately.
+        Called with the lock held, so it only sorts when `prepare` lost a race.
+        """
+        cached = self._impact_cache.get(term)
+        if cached is None:
+            cached = self._sort_impacts(self.postings[term].items(), self.doc_lengths, self.k1, self.b, avgdl)
+            self._impact_cache[term] = cached
+            self._fresh[term] = set()
+        return cached
+
+    def prepare(self, terms: List[str]):
+        """Sort the impact lists a query over `terms` will need without holding the lock.
+
+        Sorting the postings of a common term takes far longer than answering a
+        query, so it is done here on a copy while searches and adds carry on;
+        documents added meanwhile become the list's fresh set.
+        """
+        with self._lock:
+            found = [term for term in set(terms) if term in self.postings]
+            if sum(len(self.postings[term]) for term in found) <= EXHAUSTIVE_LIMIT:
+                return
+            missing = [term for term in found if term not in self._impact_cache and term not in self._building]
+            count = len(self.doc_terms)
+            avgdl = self.total_length / count if count else 1.0
+            snapshots = []
+            for term in missing:
+                self._building[term] = set()
+                snapshots.append((term, list(self.postings[term].items())))
+
+        for term, postings in snapshots:
+            try:
+                impacts = self._sort_impacts(postings, self.doc_lengths, self.k1, self.b, avgdl or 1.0)
+            except Exception:
+                with self._lock:
+                    self._building.pop(term, None)
+                raise
+            with self._lock:
+                fresh = self._building.pop(term, set())
+                if term in self.postings and term not in self._impact_cache:
+                    self._impact_cache[term] = impacts
+                    self._fresh[term] = fresh
+
+    def warm(self):
+        """Sort the impact list of every term common enough to need one, e.g. after loading"""
+        with self._lock:
+            common = [term for term, postings in self.postings.items() if len(postings) > EXHAUSTIVE_LIMIT]
+        for term in common:
+            self.prepare([term])
+
+    def _top(self, terms: List[str], k: int, exclude: Optional[int] = None) -> Tuple[int, List[Tuple[int, float]]]:
+        """Return (total matches, top k (doc, score) pairs) for the query terms"""
+        count = len(self.doc_terms)
+        found = [term for term in set(terms) if term in self.postings]
+        if not count or not found or k <= 0:
+            return 0, []
+        k1, b, postings, doc_lengths = self.k1, self.b, self.postings, self.doc_lengths
+        avgdl = self.total_length / count or 1.0
+        idfs = {
+            term: math.log(1 + (count - len(postings[term]) + 0.5) / (len(postings[term]) + 0.5))
+            for term in found
+        }
+
+        # Bind each term's postings and idf once; scoring is the hot loop of every query
+        weighted = [(postings[term], idfs[term] * (k1 + 1)) for term in found]
+
+        def score(doc: int) -> float:
+            norm = k1 * (1 - b + b * doc_lengths[doc] / avgdl)
+            total = 0.0
+            for term_postings, weight in weighted:
+                frequency = term_postings.get(doc)
+                if frequency:
+                    total += weight * frequency / (frequency + norm)
+            return total
+
+        matched = sum(len(postings[term]) for term in found)
+        if matched <= EXHAUSTIVE_LIMIT:
+            docs = set()
+            for term in found:
+                docs.update(postings[term])
+            docs.discard(exclude)
+            return len(docs), heapq.nlargest(k, ((doc, score(doc)) for doc in docs), key=lambda item: item[1])
+
+        # Threshold algorithm: walk the impact-sorted lists in step and stop once
+        # no unseen document can beat the current k-th best score
+        lists = [(term, self._impacts(term, avgdl)) for term in found]
+        seen = {exclude}
+        heap: List[Tuple[float, int]] = []
+
+        def offer(doc: int):
+            seen.add(doc)
+            if doc in self.doc_terms:
+                item = (score(doc), doc)
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+        for term in found:
+            for doc in self._fresh.get(term, ()):
+                if doc not in seen:
+                    offer(doc)
+
+        depth = 0
+        longest = max(len(impacts) for _, impacts in lists)
+        while depth < longest:
+            threshold = 0.0
+            for term, impacts in lists:
+                if depth < len(impacts):
+                    impact, doc = impacts[depth]
+                    threshold += idfs[term] * impact
+                    if doc not in seen:
+                        offer(doc)
+            # The budget only applies once the requested page can be filled
+            if len(heap) >= k and (heap[0][0] >= threshold or len(seen) > SCORE_BUDGET):
+                break
+            depth += 1
+
+        # Exact union counts are too slow for very common terms; estimate assuming independence
+        if len(found) == 1:
+            total = len(postings[found[0]])
+        else:
+            missing = 1.0
+            for term in found:
+                missing *= 1 - len(postings[term]) / count
+            total = int(round(count * (1 - missing)))
+        if exclude is not None and exclude in self.doc_terms and any(exclude in postings[term] for term in found):
+            total -= 1
+        return total, [(doc, value) for value, doc in sorted(heap, reverse=True)]
+
+    def _page(self, terms: List[str], limit: int, offset: int,
+              exclude: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        total, top = self._top(terms, offset + limit, exclude)
+        results = [
+            {"widget_id": self.widget_ids[doc], "score": round(score, 4), **self.doc_info[doc]}
+            for doc, score in top[offset:]
+        ]
+        return total, results
+
+    def search(self, query: str, limit: int = 10, offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """Return (total matches, one page of results) for a free-text query"""
+        terms = tokenize(query)
+        self.prepare(terms)
+        with self._lock:
+            return self._page(terms, limit, offset)
+
+    def similar(self, widget_id: str, limit: int = 10, offset: int = 0,
+                max_terms: int = 10) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+        """Widgets similar to an indexed widget, using its most distinctive terms as the query"""
+        with self._lock:
+            doc = self.doc_ids.get(widget_id)
+            if doc is None:
+                return None
+            terms = self.doc_terms[doc]
+            count = len(self.doc_terms)
+            weighted = sorted(
+                terms,
+                key=lambda term: terms[term] * math.log(1 + count / len(self.postings[term])),
+                reverse=True
+            )[:max_terms]
+        self.prepare(weighted)
+        with self._lock:
+            if self.doc_ids.get(widget_id) != doc:
+                return None
+            return self._page(weighted, limit, offset, exclude=doc)
+
+    def save(self, path: str):
+        """Write the index to disk atomically.
+
+        The lock is only held to freeze the index: while the snapshot is written,
+        searches keep running and adds/removes are queued, then applied afterwards.
+        """
+        with self._save_lock:
+            with self._lock:
+                self._saving = True
+                state = {key: value for key, value in self.__dict__.items() if not key.startswith("_") and key != "dirty"}
+                self.dirty = 0
+            try:
+                # Workers share the path, so each writes its own temporary file
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            finally:
+                with self._lock:
+                    self._saving = False
+                    pending, self._pending = self._pending, []
+                    for action, widget_id, widget_data, version in pending:
+                        if action == "add":
+                            self.add(widget_id, widget_data, version)
+                        else:
+                            self.remove(widget_id)
+
+    @classmethod
+    def load(cls, path: str) -> "WidgetSearchIndex":
+        """Load a saved index, or start an empty one if there is none"""
+        index = cls()
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    index.__dict__.update(pickle.load(f))
+            except Exception as e:
+                print(f"Failed to load search index: {e}")
+                index = cls()
+        return index
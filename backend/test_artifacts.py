@@ -0,0 +1,61 @@
+import pytest
+from services.artifacts import ArtifactRenderer, UnknownTargetError, content_hash
+
+WIDGET = {"widgetType": "custom", "title": "Widget", "elements": []}
+
+@pytest.fixture
+def renderer():
+    calls = []
+    renderer = ArtifactRenderer()
+
+    def make(name):
+        def render(widget_data, widget_id):
+            calls.append(name)
+            return f"{name}:{widget_data['title']}:{widget_id}"
+        return render
+
+    renderer.register("react_code", make("react_code"))
+    renderer.register("html_code", make("html_code"))
+    renderer.register("embed_code", make("embed_code"), per_widget=True)
+    renderer.calls = calls
+    return renderer
+
+def test_content_hash_ignores_key_order():
+    """Test that equal widgets hash the same"""
+    assert content_hash({"a": 1, "b": [1, 2]}) == content_hash({"b": [1, 2], "a": 1})
+    assert content_hash({"a": 1}) != content_hash({"a": 2})
+
+def test_renders_only_requested_targets(renderer):
+    """Test that unrequested artifacts are never rendered"""
+    assert renderer.render(WIDGET, "w1", []) == {}
+    assert renderer.render(WIDGET, "w1", ["react_code"]) == {"react_code": "react_code:Widget:w1"}
+    assert renderer.calls == ["react_code"]
+
+def test_artifacts_cached_by_content(renderer):
+    """Test that artifacts are reused for identical content"""
+    renderer.render(WIDGET, "w1", ["react_code", "html_code", "embed_code"])
+    assert sorted(renderer.calls) == ["embed_code", "html_code", "react_code"]
+
+    # Same content under another id reuses content-only targets
+    artifacts = renderer.render(dict(WIDGET), "w2", ["react_code", "embed_code"])
+    assert artifacts["embed_code"] == "embed_code:Widget:w2"
+    assert sorted(renderer.calls) == ["embed_code", "embed_code", "html_code", "react_code"]
+
+    # Changed content renders again
+    renderer.render({**WIDGET, "title": "New"}, "w1", ["react_code"])
+    assert renderer.calls.count("react_code") == 2
+
+def test_unknown_target(renderer):
+    """Test that unknown targets are rejected"""
+    with pytest.raises(UnknownTargetError):
+        renderer.render(WIDGET, "w1", ["vue_code"])
+
+def test_local_cache_is_bounded(renderer):
+    """Test that the in-process cache evicts old entries"""
+    renderer.max_local = 2
+    for i in range(5):
+        renderer.render({**WIDGET, "title": str(i)}, "w1", ["react_code"])
+    assert len(renderer._local) == 2
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,100 @@
+import pytest
+from services.edit_sessions import (
+    EditSession, EditSessionStore, apply_hunks, apply_json_patch, diff_json, diff_lines
+)
+
+WIDGET = {
+    "widgetType": "quiz",
+    "title": "My Quiz",
+    "elements": [
+        {"type": "question", "id": "q1", "label": "Pick one", "options": ["a", "b"]},
+        {"type": "button", "id": "submit", "label": "Submit", "style": {"color": "white"}}
+    ],
+    "styling": {"theme": "light", "primaryColor": "#3b82f6"}
+}
+
+def test_diff_json_only_changed_paths():
+    """Test that a small edit produces a small patch"""
+    updated = {**WIDGET, "styling": {"theme": "light", "primaryColor": "#22c55e"}}
+    ops = diff_json(WIDGET, updated)
+    assert ops == [{"op": "replace", "path": "/styling/primaryColor", "value": "#22c55e"}]
+
+def test_diff_json_round_trip():
+    """Test that added, removed and replaced values apply back cleanly"""
+    updated = {
+        "widgetType": "quiz",
+        "title": "Renamed/Quiz",
+        "elements": [
+            {"type": "question", "id": "q1", "label": "Pick one", "options": ["a", "b", "c"]}
+        ],
+        "styling": {"theme": "dark"},
+        "logic": {"onSubmit": "Show score"}
+    }
+    ops = diff_json(WIDGET, updated)
+    assert apply_json_patch(WIDGET, ops) == updated
+    assert diff_json(WIDGET, WIDGET) == []
+
+def test_diff_lines_round_trip():
+    """Test that code hunks rebuild the new code from the old"""
+    old = "line 1\nline 2\nline 3\nline 4\n"
+    new = "line 1\nline two\nline 3\nline 4\nline 5\n"
+    hunks = diff_lines(old, new)
+    assert len(hunks) == 2
+    assert apply_hunks(old, hunks) == new
+
+def test_diff_lines_only_splits_on_newline():
+    """Test that hunk indices match a client that splits on \\n only"""
+    old = "a\nlabel \u2028 one\r\nb\n"
+    new = "a\nlabel \u2028 two\r\nb\n"
+    hunks = diff_lines(old, new)
+    assert hunks == [{"start": 1, "delete": 1, "lines": ["label \u2028 two\r\n"]}]
+    assert apply_hunks(old, hunks) == new
+
+def test_session_resume_replays_missed_patches():
+    """Test that a resuming client gets only the patches it missed"""
+    session = EditSession("w1", WIDGET)
+    first = session.record_edit({**WIDGET, "title": "A"}, [], {}, "rename to A")
+    second = session.record_edit({**WIDGET, "title": "B"}, [], {}, "rename to B")
+
+    assert session.version == 2
+    assert session.patches_since(2) == []
+    assert session.patches_since(1) == [second]
+    assert session.patches_since(0) == [first, second]
+    assert session.patches_since(5) is None
+    assert session.history[0] == {"role": "user", "content": "rename to A"}
+
+def test_session_store_in_memory():
+    """Test that sessions round-trip through the store without Redis"""
+    store = EditSessionStore()
+    assert store.get("w1") is None
+
+    session = EditSession("w1", WIDGET)
+    session.record_edit({**WIDGET, "title": "A"}, [], {}, "rename to A")
+    store.save(session)
+
+    loaded = store.get("w1")
+    assert loaded.version == 1
+    assert loaded.widget_data["title"] == "A"
+
+def test_session_store_save_if_current():
+    """Test that an edit is only saved over the session it was made from"""
+    store = EditSessionStore()
+    session = EditSession("w1", WIDGET)
+    store.save(session)
+
+    edited = store.get("w1")
+    edited.record_edit({**WIDGET, "title": "A"}, [], {}, "rename to A")
+    assert store.save_if_current(edited, 0)
+
+    # A second edit from the same base version lost the race
+    stale = EditSession("w1", WIDGET, session_id=session.session_id)
+    stale.record_edit({**WIDGET, "title": "B"}, [], {}, "rename to B")
+    assert not store.save_if_current(stale, 0)
+
+    # So does an edit of a session another client replaced
+    store.save(EditSession("w1", WIDGET))
+    assert not store.save_if_current(edited, 1)
+    assert store.get("w1").widget_data["title"] == "My Quiz"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
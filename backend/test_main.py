@@ -1,5 +1,7 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
+import main
 from main import app
 
 client = TestClient(app)
@@ -37,5 +39,262 @@ def test_generate_widget_empty_prompt():
     # Should still work with fallback widget
     assert response.status_code == 200
 
+def test_generate_widget_fields():
+    """Test that fields= skips code artifacts"""
+    response = client.post("/api/generate-widget?fields=widget_id,widget_data", json={
+        "prompt": "A BMI calculator"
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert "widget_data" in data
+    assert "react_code" not in data
+    assert "embed_code" not in data
+
+def test_generate_widget_unknown_field():
+    """Test that unknown fields are rejected"""
+    response = client.post("/api/generate-widget?fields=widget_data,vue_code", json={
+        "prompt": "A BMI calculator"
+    })
+    assert response.status_code == 400
+
+def test_artifacts():
+    """Test on-demand artifact rendering"""
+    widget_data = {"widgetType": "custom", "title": "Test Widget", "elements": []}
+    response = client.post("/api/artifacts", json={
+        "widget_id": "test",
+        "widget_data": widget_data,
+        "targets": ["html_code", "embed_code"]
+    })
+    assert response.status_code == 200
+    artifacts = response.json()["artifacts"]
+    assert set(artifacts) == {"html_code", "embed_code"}
+    assert "<!DOCTYPE html>" in artifacts["html_code"]
+
+def test_react_artifact_renders_question_options():
+    """Test that every question option becomes a radio input"""
+    widget_data = {
+        "widgetType": "quiz",
+        "title": "Quiz",
+        "elements": [{"type": "question", "id": "q1", "label": "Pick one", "options": ["Red", "Blue"]}]
+    }
+    response = client.post("/api/artifacts", json={
+        "widget_id": "test",
+        "widget_data": widget_data,
+        "targets": ["react_code"]
+    })
+    assert response.status_code == 200
+    react_code = response.json()["artifacts"]["react_code"]
+    assert react_code.count('type="radio"') == 2
+    assert 'value="Blue"' in react_code
+
+def test_html_artifact_escapes_widget_values():
+    """Test that widget values cannot break out of the exported page's attributes"""
+    widget_data = {
+        "widgetType": "custom",
+        "title": None,
+        "styling": {"primaryColor": '#fff" onmouseover="alert(1)'},
+        "elements": [
+            {"type": "text", "id": 7, "label": None, "style": {"fontSize": '1px" onclick="x'}},
+            {"type": "button", "id": "b", "label": "<b>Go</b>", "style": {"color": '"><script>x</script>'}},
+            {"type": "question", "id": "q", "label": "Pick", "options": [1, None]}
+        ]
+    }
+    response = client.post("/api/artifacts", json={
+        "widget_id": "test",
+        "widget_data": widget_data,
+        "targets": ["html_code"]
+    })
+    assert response.status_code == 200
+    page = response.json()["artifacts"]["html_code"]
+    assert 'onmouseover="' not in page
+    assert 'onclick="' not in page
+    assert "<script>x" not in page
+    assert "&lt;b&gt;Go&lt;/b&gt;" in page
+
+def test_stored_widget_search_and_fetch():
+    """Test that stored widgets can be found and fetched for reuse"""
+    widget_id = "stored-bmi-widget"
+    main.save_widget(widget_id, {"widgetType": "calculator", "title": "Stored BMI Calculator", "elements": []})
+
+    response = client.get("/api/widgets/search", params={"q": "stored bmi"})
+    assert response.status_code == 200
+    assert response.json()["results"][0]["widget_id"] == widget_id
+
+    response = client.get(f"/api/widgets/{widget_id}", params={"fields": "widget_id,widget_data"})
+    assert response.status_code == 200
+    assert response.json()["widget_data"]["title"] == "Stored BMI Calculator"
+    assert "react_code" not in response.json()
+
+    assert client.get("/api/widgets/missing-widget").status_code == 404
+
+def test_refresh_skips_bad_rows():
+    """Test that one unindexable stored row does not stop search from catching up"""
+    db = main.SessionLocal()
+    db.add(main.Widget(id="bad-row-widget", title="Bad", widget_data="[1, 2]"))
+    db.add(main.Widget(id="numeric-label-widget", title="Numeric", widget_data=json.dumps(
+        {"widgetType": "form", "title": "Numeric Label Survey", "elements": [{"type": "text", "label": 12}]}
+    )))
+    db.commit()
+    db.close()
+
+    before = main.search_index.watermark
+    main.refresh_search_index(force=True)
+    assert main.search_index.watermark != before
+    assert client.get("/api/widgets/search", params={"q": "numeric 12"}).json()["results"][0]["widget_id"] == "numeric-label-widget"
+
+def test_search_offset_is_capped():
+    """Test that pages deeper than MAX_OFFSET are refused"""
+    response = client.get("/api/widgets/search", params={"q": "widget", "offset": main.MAX_OFFSET + 1})
+    assert response.status_code == 422
+
+def test_edits_do_not_overwrite_shared_widgets(monkeypatch):
+    """Test that only the owner's edits replace a stored widget, and failed edits are never stored"""
+    widget_id = "shared-owned-widget"
+    original = {"widgetType": "form", "title": "Shared Feedback Form", "elements": []}
+    main.save_widget(widget_id, original, user_id="owner")
+    monkeypatch.setattr(main, "edit_widget_with_ai", lambda current, prompt, deadline: {**current, "title": "Edited Form"})
+
+    def edit(user_id=None, current_widget=original):
+        return client.post("/api/edit-widget", json={
+            "widget_id": widget_id,
+            "edit_prompt": "Rename it",
+            "current_widget": current_widget,
+            "user_id": user_id
+        })
+
+    assert edit(user_id="someone-else").json()["widget_data"]["title"] == "Edited Form"
+    assert edit().status_code == 200
+    assert client.get(f"/api/widgets/{widget_id}").json()["widget_data"]["title"] == "Shared Feedback Form"
+
+    edit(user_id="owner")
+    assert client.get(f"/api/widgets/{widget_id}").json()["widget_data"]["title"] == "Edited Form"
+
+    # A failed model call echoes the client's widget back; that is not stored
+    monkeypatch.setattr(main, "edit_widget_with_ai", lambda current, prompt, deadline: current)
+    edit(user_id="owner", current_widget={"widgetType": "form", "title": "Client Copy", "elements": []})
+    assert client.get(f"/api/widgets/{widget_id}").json()["widget_data"]["title"] == "Edited Form"
+
+def test_fallback_widget_not_indexed():
+    """Test that the fallback returned during an outage is not stored"""
+    before = len(main.search_index)
+    response = client.post("/api/generate-widget", json={"prompt": "A widget while the AI is down"})
+    assert response.status_code == 200
+    assert response.json()["widget_data"] == main.FALLBACK_WIDGET
+    assert len(main.search_index) == before
+
+def test_edit_widget_reports_open_circuit(monkeypatch):
+    """Test that an edit refused by the circuit breaker is an error, not the unchanged widget"""
+    monkeypatch.setattr(main.openai_breaker, "allow_request", lambda: False)
+    response = client.post("/api/edit-widget", json={
+        "widget_id": "test",
+        "edit_prompt": "Make it blue",
+        "current_widget": {"widgetType": "custom", "title": "Widget", "elements": []}
+    })
+    assert response.status_code == 503
+
+SESSION_WIDGET = {"widgetType": "custom", "title": "Session Widget", "elements": []}
+
+@pytest.fixture
+def fake_edit(monkeypatch):
+    """Replace the streamed model call with a canned reply"""
+    replies = []
+
+    def stream_edit(current_widget, edit_prompt, history, deadline, on_progress):
+        on_progress(1000)
+        reply = replies.pop(0)
+        return reply() if callable(reply) else reply
+
+    monkeypatch.setattr(main, "stream_edit_with_ai", stream_edit)
+    return replies
+
+def test_edit_session_start_edit_resume(fake_edit):
+    """Test that an edit session sends diffs and resumes with a version check"""
+    fake_edit.append({**SESSION_WIDGET, "title": "Renamed"})
+    with client.websocket_connect("/ws/edit/ws-test-1") as websocket:
+        websocket.send_json({"type": "start", "widget_data": SESSION_WIDGET})
+        ready = websocket.receive_json()
+        assert ready["type"] == "ready" and ready["version"] == 0
+
+        websocket.send_json({
+            "type": "edit",
+            "session_id": ready["session_id"],
+            "version": 0,
+            "edit_prompt": "Rename it",
+            "code_fields": ["react_code"]
+        })
+        message = websocket.receive_json()
+        while message["type"] == "progress":
+            message = websocket.receive_json()
+        assert message["type"] == "patch"
+        assert message["version"] == 1
+        assert message["widget_ops"] == [{"op": "replace", "path": "/title", "value": "Renamed"}]
+        assert "react_code" in message["code_hunks"]
+
+    with client.websocket_connect("/ws/edit/ws-test-1") as websocket:
+        websocket.send_json({"type": "resume", "session_id": ready["session_id"], "version": 1})
+        assert websocket.receive_json() == {"type": "ready", "session_id": ready["session_id"], "version": 1}
+
+        # A matching version from another session gets a snapshot, not "ready"
+        websocket.send_json({"type": "resume", "session_id": "other", "version": 1})
+        snapshot = websocket.receive_json()
+        assert snapshot["type"] == "snapshot"
+        assert snapshot["widget_data"]["title"] == "Renamed"
+
+def test_edit_session_resync_and_bad_input(fake_edit):
+    """Test that unknown sessions, bad messages and bad model replies get error messages"""
+    fake_edit.append(["not", "a", "widget"])
+    with client.websocket_connect("/ws/edit/ws-test-2") as websocket:
+        websocket.send_json({"type": "edit", "edit_prompt": "Make it blue"})
+        assert websocket.receive_json() == {"type": "resync_required"}
+
+        websocket.send_json({"type": "dance"})
+        assert websocket.receive_json()["type"] == "error"
+
+        websocket.send_json(["not", "an", "object"])
+        assert websocket.receive_json()["type"] == "error"
+
+        websocket.send_json({"type": "resume", "version": "1"})
+        assert websocket.receive_json()["type"] == "error"
+
+        websocket.send_json({"type": "start", "widget_data": SESSION_WIDGET})
+        ready = websocket.receive_json()
+        assert ready["type"] == "ready"
+        websocket.send_json({"type": "edit", "session_id": ready["session_id"], "version": 0, "edit_prompt": "Make it blue"})
+        message = websocket.receive_json()
+        while message["type"] == "progress":
+            message = websocket.receive_json()
+        assert message["type"] == "error"
+        assert message["version"] == 0
+
+def test_edit_session_refuses_stale_edits(fake_edit):
+    """Test that edits against another session, or racing one, get a snapshot instead of a patch"""
+    with client.websocket_connect("/ws/edit/ws-test-3") as websocket:
+        websocket.send_json({"type": "start", "widget_data": SESSION_WIDGET})
+        first = websocket.receive_json()
+
+        # Another tab starts its own session on the same widget
+        with client.websocket_connect("/ws/edit/ws-test-3") as other:
+            other.send_json({"type": "start", "widget_data": {**SESSION_WIDGET, "title": "Other Tab"}})
+            second = other.receive_json()
+
+        websocket.send_json({"type": "edit", "session_id": first["session_id"], "version": 0, "edit_prompt": "Rename it"})
+        snapshot = websocket.receive_json()
+        assert snapshot["type"] == "snapshot"
+        assert snapshot["session_id"] == second["session_id"]
+        assert snapshot["widget_data"]["title"] == "Other Tab"
+
+        # A start from another connection lands while the model is still writing this edit
+        def restarted_meanwhile():
+            main.edit_sessions.save(main.EditSession("ws-test-3", {**SESSION_WIDGET, "title": "Newest"}))
+            return {**SESSION_WIDGET, "title": "Lost Race"}
+
+        fake_edit.append(restarted_meanwhile)
+        websocket.send_json({"type": "edit", "session_id": second["session_id"], "version": 0, "edit_prompt": "Rename it"})
+        message = websocket.receive_json()
+        while message["type"] == "progress":
+            message = websocket.receive_json()
+        assert message["type"] == "snapshot"
+        assert message["widget_data"]["title"] == "Newest"
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,128 @@
+import pytest
+import time
+from services.resilience import (
+    CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, call_with_retries
+)
+
+def test_deadline_remaining_and_check():
+    """Test deadline budget accounting"""
+    deadline = Deadline(10)
+    assert 9 < deadline.remaining() <= 10
+    assert deadline.remaining(reserve=5) <= 5
+    deadline.check()
+
+    expired = Deadline(0)
+    assert expired.expired()
+    with pytest.raises(DeadlineExceeded):
+        expired.check("rendering")
+
+def test_retries_until_success():
+    """Test that transient failures are retried"""
+    calls = []
+
+    def flaky(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise ConnectionError("upstream down")
+        return "ok"
+
+    result = call_with_retries(flaky, Deadline(5), max_retries=2, base_delay=0.001)
+    assert result == "ok"
+    assert len(calls) == 3
+    assert all(0 < timeout <= 5 for timeout in calls)
+
+def test_retries_are_bounded():
+    """Test that retries stop after max_retries"""
+    calls = []
+
+    def failing(timeout):
+        calls.append(timeout)
+        raise ConnectionError("upstream down")
+
+    with pytest.raises(ConnectionError):
+        call_with_retries(failing, Deadline(5), max_retries=1, base_delay=0.001)
+    assert len(calls) == 2
+
+def test_no_call_past_deadline():
+    """Test that an exhausted deadline never reaches upstream"""
+    with pytest.raises(DeadlineExceeded):
+        call_with_retries(lambda timeout: "ok", Deadline(1), reserve=2)
+
+def test_circuit_opens_and_fails_fast():
+    """Test that the breaker opens after repeated failures"""
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    calls = []
+
+    def failing(timeout):
+        calls.append(timeout)
+        raise ConnectionError("upstream down")
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            call_with_retries(failing, Deadline(5), breaker=breaker, max_retries=0)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(failing, Deadline(5), breaker=breaker)
+    assert len(calls) == 2
+
+def test_circuit_half_open_probe():
+    """Test that a half-open breaker lets one probe through and closes on success"""
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def test_only_transient_errors_are_retried():
+    """Test that 4xx errors fail at once and never count against the breaker"""
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    calls = []
+
+    def bad_request(timeout):
+        calls.append(timeout)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        call_with_retries(bad_request, Deadline(5), breaker=breaker, max_retries=2)
+    assert len(calls) == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    def rate_limited(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise StatusError(429)
+        return "ok"
+
+    assert call_with_retries(rate_limited, Deadline(5), max_retries=2, base_delay=0.001) == "ok"
+
+def test_half_open_probe_released_on_deadline_and_non_transient_error():
+    """Test that a half-open probe is not left locked"""
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    with pytest.raises(DeadlineExceeded):
+        call_with_retries(lambda timeout: "ok", Deadline(1), breaker=breaker, reserve=2)
+    def unauthorized(timeout):
+        raise StatusError(401)
+
+    with pytest.raises(StatusError):
+        call_with_retries(unauthorized, Deadline(5), breaker=breaker)
+
+    assert breaker.allow_request()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
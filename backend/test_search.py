@@ -0,0 +1,151 @@
+import pytest
+from services import search
+from services.search import WidgetSearchIndex, widget_terms
+
+def make_widget(title, widget_type="custom", description="", labels=()):
+    return {
+        "widgetType": widget_type,
+        "title": title,
+        "description": description,
+        "elements": [{"type": "text", "id": f"e{i}", "label": label} for i, label in enumerate(labels)]
+    }
+
+@pytest.fixture
+def index():
+    index = WidgetSearchIndex()
+    index.add("bmi", make_widget("BMI Calculator", "calculator", "Work out your body mass index", ["Height", "Weight"]))
+    index.add("tip", make_widget("Tip Calculator", "calculator", "Split the bill", ["Bill amount", "Tip percent"]))
+    index.add("quiz", make_widget("Friends Quiz", "quiz", "How well do you know me", ["Favourite color?"]))
+    index.add("timer", make_widget("Countdown Timer", "timer", "Count down to zero", ["Minutes"]))
+    return index
+
+def test_widget_terms_fields():
+    """Test that title, description, labels and type are all indexed"""
+    terms = widget_terms(make_widget("BMI Calculator", "calculator", "Body mass", ["Height"]))
+    assert terms["bmi"] == 2
+    assert terms["calculator"] == 3
+    assert "body" in terms and "height" in terms
+
+def test_widget_terms_non_string_fields():
+    """Test that numbers are indexed as text and nested values are skipped"""
+    terms = widget_terms({"title": 2024, "description": {"nested": "x"}, "widgetType": None,
+                          "elements": [{"label": 12}, {"label": ["a"]}, "not an element"]})
+    assert terms == {"2024": 2, "12": 1}
+    assert widget_terms({"title": "Poll", "elements": 5}) == {"poll": 2}
+
+def test_add_same_version_is_noop(index):
+    """Test that re-adding an unchanged widget keeps its doc id"""
+    index.add("poll", make_widget("Quick Poll", "form"), version=1)
+    doc = index.doc_ids["poll"]
+    index.add("poll", make_widget("Quick Poll", "form"), version=1)
+    assert index.doc_ids["poll"] == doc
+    index.add("poll", make_widget("Quick Survey", "form"), version=2)
+    assert index.doc_ids["poll"] != doc
+    assert index.indexed_version("poll") == 2
+
+def test_impact_lists_prepared_ahead(monkeypatch):
+    """Test that prepare sorts impact lists that searches then reuse"""
+    index = WidgetSearchIndex()
+    for i in range(50):
+        index.add(str(i), make_widget("feedback form" + " extra" * (i % 5)))
+    monkeypatch.setattr(search, "EXHAUSTIVE_LIMIT", 10)
+
+    index.warm()
+    assert set(index._impact_cache) >= {"feedback", "form"}
+    cached = index._impact_cache["form"]
+    index.search("feedback form", limit=5)
+    assert index._impact_cache["form"] is cached
+
+def test_search_ranks_best_match_first(index):
+    """Test BM25 ranking"""
+    total, results = index.search("bmi calculator")
+    assert total == 2
+    assert [result["widget_id"] for result in results] == ["bmi", "tip"]
+    assert results[0]["title"] == "BMI Calculator"
+
+def test_search_pagination(index):
+    """Test limit and offset"""
+    total, results = index.search("calculator", limit=1, offset=1)
+    assert total == 2
+    assert len(results) == 1
+
+def test_reindex_and_remove(index):
+    """Test that re-adding a widget replaces its old terms"""
+    index.add("quiz", make_widget("Movie Trivia", "quiz"))
+    assert index.search("friends")[0] == 0
+    assert index.search("trivia")[1][0]["widget_id"] == "quiz"
+
+    index.remove("quiz")
+    assert index.search("trivia")[0] == 0
+    assert len(index) == 3
+
+def test_similar(index):
+    """Test similar widget lookup"""
+    total, results = index.similar("bmi")
+    assert results[0]["widget_id"] == "tip"
+    assert all(result["widget_id"] != "bmi" for result in results)
+    assert index.similar("missing") is None
+
+def test_early_termination_matches_exhaustive(monkeypatch):
+    """Test that the impact-ordered path finds the same top results"""
+    index = WidgetSearchIndex()
+    for i in range(300):
+        words = ["form"] + (["feedback"] * (i % 4)) + ["extra"] * (i % 7)
+        index.add(str(i), make_widget(" ".join(words)))
+
+    expected = [result["score"] for result in index.search("feedback form", limit=5)[1]]
+    monkeypatch.setattr(search, "EXHAUSTIVE_LIMIT", 0)
+    assert [result["score"] for result in index.search("feedback form", limit=5)[1]] == expected
+
+    # Widgets added after the impact lists were sorted are still found
+    index.add("new", make_widget("feedback feedback feedback feedback form"))
+    assert index.search("feedback form", limit=1)[1][0]["widget_id"] == "new"
+
+def test_deep_pages_on_early_termination_path():
+    """Test that pages past the score budget are still filled"""
+    index = WidgetSearchIndex()
+    for i in range(3000):
+        index.add(str(i), make_widget("form"))
+
+    total, results = index.search("form", limit=10, offset=2500)
+    assert total == 3000
+    assert len(results) == 10
+
+def test_writes_during_save_are_applied_afterwards(index, tmp_path, monkeypatch):
+    """Test that adds made while a snapshot is written are queued, not lost"""
+    path = str(tmp_path / "index.pkl")
+    real_dump = search.pickle.dump
+
+    def dump_while_adding(state, f, protocol):
+        index.add("poll", make_widget("Quick Poll", "form"))
+        index.remove("timer")
+        assert index.search("poll")[0] == 0
+        real_dump(state, f, protocol=protocol)
+
+    monkeypatch.setattr(search.pickle, "dump", dump_while_adding)
+    index.save(path)
+    assert index.search("poll")[1][0]["widget_id"] == "poll"
+    assert index.search("timer")[0] == 0
+    assert index.dirty == 2
+
+    monkeypatch.undo()
+    loaded = WidgetSearchIndex.load(path)
+    assert loaded.search("poll")[0] == 0
+    assert loaded.search("timer")[0] == 1
+
+def test_save_and_load(index, tmp_path):
+    """Test that the index survives a round-trip to disk"""
+    path = str(tmp_path / "index.pkl")
+    index.save(path)
+    assert index.dirty == 0
+
+    loaded = WidgetSearchIndex.load(path)
+    assert len(loaded) == 4
+    assert loaded.search("timer")[1][0]["widget_id"] == "timer"
+    loaded.add("new", make_widget("Timer Two", "timer"))
+    assert loaded.search("timer")[0] == 2
+
+    assert len(WidgetSearchIndex.load(str(tmp_path / "missing.pkl"))) == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__])
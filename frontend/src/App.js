@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { 
   Sparkles, 
@@ -17,9 +17,13 @@ import axios from 'axios';
 import WidgetPreview from './components/WidgetPreview';
 import ChatEditor from './components/ChatEditor';
 import CodeViewer from './components/CodeViewer';
+import { createEditSession } from './editSession';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 
+// The preview only needs widget_data; code artifacts are fetched when first needed
+const PREVIEW_FIELDS = 'widget_id,widget_data,timestamp';
+
 function App() {
   const [currentView, setCurrentView] = useState('landing');
   const [prompt, setPrompt] = useState('');
@@ -28,12 +32,57 @@ function App() {
   const [examples, setExamples] = useState([]);
   const [chatHistory, setChatHistory] = useState([]);
   const [showCode, setShowCode] = useState(false);
+  const [editProgress, setEditProgress] = useState(null);
+  const editSessionRef = useRef(null);
 
   useEffect(() => {
     // Load example prompts
     loadExamples();
   }, []);
 
+  const widgetId = widgetData?.widget_id;
+
+  const loadArtifacts = async (targets) => {
+    const missing = targets.filter((name) => typeof widgetData[name] !== 'string');
+    if (missing.length === 0) return widgetData;
+
+    const response = await axios.post(`${API_BASE_URL}/api/artifacts`, {
+      widget_id: widgetData.widget_id,
+      widget_data: widgetData.widget_data,
+      targets: missing
+    });
+    const updated = { ...widgetData, ...response.data.artifacts };
+    setWidgetData(updated);
+    if (editSessionRef.current) editSessionRef.current.sync(response.data.artifacts);
+    return updated;
+  };
+
+  useEffect(() => {
+    if (showCode && widgetData) {
+      loadArtifacts(['react_code', 'embed_code']).catch((error) => {
+        console.error('Failed to load code:', error);
+      });
+    }
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [showCode, widgetData]);
+
+  useEffect(() => {
+    // Open a WebSocket edit session for the current widget; edits then only move diffs
+    if (!widgetId || typeof WebSocket === 'undefined') return undefined;
+
+    const session = createEditSession(API_BASE_URL, widgetData, {
+      onUpdate: setWidgetData,
+      onProgress: setEditProgress
+    });
+    editSessionRef.current = session;
+
+    return () => {
+      session.close();
+      editSessionRef.current = null;
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [widgetId]);
+
   const loadExamples = async () => {
     try {
       const response = await axios.get(`${API_BASE_URL}/api/examples`);
@@ -56,7 +105,7 @@ function App() {
     try {
       const response = await axios.post(`${API_BASE_URL}/api/generate-widget`, {
         prompt: inputPrompt
-      });
+      }, { params: { fields: PREVIEW_FIELDS } });
       
       setWidgetData(response.data);
       setCurrentView('widget');
@@ -90,15 +139,23 @@ function App() {
     };
 
     setChatHistory(prev => [...prev, newChatEntry]);
+    setEditProgress(null);
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/edit-widget`, {
-        widget_id: widgetData.widget_id,
-        edit_prompt: editPrompt,
-        current_widget: widgetData.widget_data
-      });
+      const session = editSessionRef.current;
+      if (session && session.isOpen()) {
+        await session.edit(editPrompt);
+      } else {
+        const response = await axios.post(`${API_BASE_URL}/api/edit-widget`, {
+          widget_id: widgetData.widget_id,
+          edit_prompt: editPrompt,
+          current_widget: widgetData.widget_data
+        }, { params: { fields: PREVIEW_FIELDS } });
 
-      setWidgetData(response.data);
+        setWidgetData(response.data);
+        // Keep the server-held session on the widget we now show
+        if (session) session.restart(response.data);
+      }
       
       setChatHistory(prev => [...prev, {
         type: 'assistant',
@@ -112,6 +169,8 @@ function App() {
         message: 'Failed to apply changes. Please try again.',
         timestamp: new Date()
       }]);
+    } finally {
+      setEditProgress(null);
     }
   };
 
@@ -124,10 +183,16 @@ function App() {
     navigator.clipboard.writeText(text);
   };
 
-  const downloadCode = () => {
+  const copyEmbedCode = async () => {
+    const updated = await loadArtifacts(['embed_code']);
+    copyToClipboard(updated.embed_code);
+  };
+
+  const downloadCode = async () => {
     if (!widgetData) return;
     
-    const blob = new Blob([widgetData.react_code], { type: 'text/javascript' });
+    const updated = await loadArtifacts(['react_code']);
+    const blob = new Blob([updated.react_code], { type: 'text/javascript' });
     const url = URL.createObjectURL(blob);
     const a = document.createElement('a');
     a.href = url;
@@ -331,7 +396,7 @@ function App() {
                       <span>Download</span>
                     </button>
                     <button
-                      onClick={() => copyToClipboard(widgetData.embed_code)}
+                      onClick={copyEmbedCode}
                       className="btn-secondary text-sm flex items-center space-x-2"
                     >
                       <Copy className="h-4 w-4" />
@@ -342,8 +407,8 @@ function App() {
                 
                 {showCode ? (
                   <CodeViewer 
-                    reactCode={widgetData.react_code}
-                    embedCode={widgetData.embed_code}
+                    reactCode={widgetData.react_code || '// Loading...'}
+                    embedCode={widgetData.embed_code || '<!-- Loading... -->'}
                   />
                 ) : (
                   <WidgetPreview widgetData={widgetData.widget_data} />
@@ -356,6 +421,7 @@ function App() {
                 <ChatEditor
                   chatHistory={chatHistory}
                   onEdit={handleEdit}
+                  progress={editProgress}
                   widgetTitle={widgetData.widget_data.title}
                 />
               </div>
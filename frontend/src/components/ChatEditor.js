@@ -2,7 +2,7 @@ import React, { useState, useRef, useEffect } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Send, MessageSquare, User, Bot, AlertCircle } from 'lucide-react';
 
-const ChatEditor = ({ chatHistory, onEdit, widgetTitle }) => {
+const ChatEditor = ({ chatHistory, onEdit, widgetTitle, progress }) => {
   const [message, setMessage] = useState('');
   const [isTyping, setIsTyping] = useState(false);
   const messagesEndRef = useRef(null);
@@ -13,7 +13,7 @@ const ChatEditor = ({ chatHistory, onEdit, widgetTitle }) => {
 
   useEffect(() => {
     scrollToBottom();
-  }, [chatHistory]);
+  }, [chatHistory, progress]);
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -124,6 +124,9 @@ const ChatEditor = ({ chatHistory, onEdit, widgetTitle }) => {
                   <div className="w-2 h-2 bg-green-400 rounded-full animate-bounce" style={{ animationDelay: '0.1s' }}></div>
                   <div className="w-2 h-2 bg-green-400 rounded-full animate-bounce" style={{ animationDelay: '0.2s' }}></div>
                 </div>
+                {progress > 0 && (
+                  <p className="text-xs text-green-700 mt-1">Writing changes... {progress} characters</p>
+                )}
               </div>
             </div>
           </motion.div>
@@ -0,0 +1,172 @@
+// WebSocket edit session: the server keeps the widget, we only receive diffs.
+
+const RECONNECT_DELAY_MS = 1000;
+
+const unescapeToken = (token) => token.replace(/~1/g, '/').replace(/~0/g, '~');
+
+export const applyJsonPatch = (document, ops) => {
+  let result = JSON.parse(JSON.stringify(document));
+
+  ops.forEach((op) => {
+    if (op.path === '') {
+      result = op.value;
+      return;
+    }
+
+    const tokens = op.path.split('/').slice(1).map(unescapeToken);
+    const last = tokens.pop();
+    const parent = tokens.reduce((node, token) => node[Array.isArray(node) ? Number(token) : token], result);
+
+    if (Array.isArray(parent)) {
+      const index = Number(last);
+      if (op.op === 'add') parent.splice(index, 0, op.value);
+      else if (op.op === 'remove') parent.splice(index, 1);
+      else parent[index] = op.value;
+    } else if (op.op === 'remove') {
+      delete parent[last];
+    } else {
+      parent[last] = op.value;
+    }
+  });
+
+  return result;
+};
+
+export const applyHunks = (text, hunks) => {
+  const lines = text.match(/[^\n]*\n|[^\n]+$/g) || [];
+  [...hunks].reverse().forEach((hunk) => {
+    lines.splice(hunk.start, hunk.delete, ...hunk.lines);
+  });
+  return lines.join('');
+};
+
+const CODE_FIELDS = ['react_code', 'embed_code', 'html_code'];
+
+// Code artifacts are loaded lazily, so only diff the ones we already hold
+const heldCodeFields = (widget) => CODE_FIELDS.filter((name) => typeof widget[name] === 'string');
+
+export const applyPatch = (widget, patch) => {
+  const updated = { ...widget, widget_data: applyJsonPatch(widget.widget_data, patch.widget_ops) };
+  Object.entries(patch.code_hunks).forEach(([name, hunks]) => {
+    if (typeof widget[name] === 'string') updated[name] = applyHunks(widget[name], hunks);
+  });
+  return updated;
+};
+
+export const createEditSession = (apiBaseUrl, widget, { onUpdate, onProgress }) => {
+  const url = `${apiBaseUrl.replace(/^http/, 'ws')}/ws/edit/${widget.widget_id}`;
+  let current = widget;
+  let sessionId = null;
+  let version = null;
+  let socket = null;
+  let closed = false;
+  let pending = null;
+
+  const send = (message) => socket.send(JSON.stringify(message));
+
+  // Edits name the session and version they were made against; the server refuses stale ones
+  const sendEdit = () => {
+    pending.sent = true;
+    send({
+      type: 'edit',
+      session_id: sessionId,
+      version,
+      edit_prompt: pending.editPrompt,
+      code_fields: heldCodeFields(current),
+    });
+  };
+
+  const resume = () => send({ type: 'resume', session_id: sessionId, version, code_fields: heldCodeFields(current) });
+
+  const handleMessage = (event) => {
+    const message = JSON.parse(event.data);
+
+    switch (message.type) {
+      case 'ready':
+        sessionId = message.session_id;
+        version = message.version;
+        if (pending && !pending.sent) sendEdit();
+        break;
+      case 'resync_required':
+        // The server lost the session: start a new one and replay the refused edit once it is ready
+        if (pending) pending.sent = false;
+        sessionId = null;
+        version = null;
+        send({ type: 'start', widget_data: current.widget_data });
+        break;
+      case 'snapshot':
+        sessionId = message.session_id;
+        version = message.version;
+        current = { ...current, widget_data: message.widget_data };
+        heldCodeFields(message).forEach((name) => {
+          current[name] = message[name];
+        });
+        onUpdate(current);
+        // The widget changed in another tab or connection, so a pending edit was not applied
+        if (pending) pending.reject(new Error('The widget changed elsewhere, please try the edit again'));
+        pending = null;
+        break;
+      case 'progress':
+        if (onProgress) onProgress(message.received_chars);
+        break;
+      case 'patch':
+        if (message.session_id !== sessionId || message.base_version !== version) {
+          // Not made against the document we hold: fetch what we missed instead of applying it
+          resume();
+          break;
+        }
+        version = message.version;
+        current = applyPatch(current, message);
+        onUpdate(current);
+        if (pending) pending.resolve(current);
+        pending = null;
+        break;
+      case 'error':
+        if (pending) pending.reject(new Error(message.message));
+        pending = null;
+        break;
+      default:
+        break;
+    }
+  };
+
+  const connect = () => {
+    socket = new WebSocket(url);
+    socket.onopen = () => {
+      // Resuming only costs a version check when nothing changed while we were away
+      if (version === null) send({ type: 'start', widget_data: current.widget_data });
+      else resume();
+    };
+    socket.onmessage = handleMessage;
+    socket.onclose = () => {
+      if (pending) pending.reject(new Error('Connection lost'));
+      pending = null;
+      if (!closed) setTimeout(connect, RECONNECT_DELAY_MS);
+    };
+  };
+
+  connect();
+
+  return {
+    // Keep artifacts fetched outside the session (e.g. when opening the code view)
+    sync: (widget) => {
+      current = { ...current, ...widget };
+    },
+    // Replace the server-side session after the widget changed outside it (e.g. an HTTP edit)
+    restart: (widget) => {
+      current = widget;
+      sessionId = null;
+      version = null;
+      if (socket.readyState === WebSocket.OPEN) send({ type: 'start', widget_data: current.widget_data });
+    },
+    isOpen: () => socket.readyState === WebSocket.OPEN && version !== null,
+    edit: (editPrompt) => new Promise((resolve, reject) => {
+      pending = { resolve, reject, editPrompt, sent: false };
+      sendEdit();
+    }),
+    close: () => {
+      closed = true;
+      socket.close();
+    },
+  };
+};